@@ -1,9 +1,22 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from collections import Counter
-import numpy as np
+import html
+import json
+
+# Importé en premier : mesure du démarrage à froid
+from timing import METRICS, STARTUP
+
+from catalogue import CatalogueStore
+from experiences import ExperienceStore, satisfaction_rate
+from refresher import BackgroundRefresher
+from recommendation import (CAS_USAGE_OPTIONS, CHARGEMENT_CHOICES, COUVERTURE_OPTIONS,
+                            EXPERIENCE_SORT, EXPERIENCE_WEIGHT, NB_ADULTES_OPTIONS,
+                            NB_ENFANTS_OPTIONS, PEDALER_OPTIONS, SORT_OPTIONS,
+                            TERRITOIRE_OPTIONS, RecommendationCache, build_criteria,
+                            criteria_key)
+from settings import DEBUG_PANEL, PRECOMPUTE_LATTICE, STARTUP_REPORT
+
+# plotly (onglet Statistiques) et le treillis sont importés à la demande
+STARTUP.mark("imports")
 
 # Configuration de la page
 st.set_page_config(
@@ -54,186 +67,121 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-@st.cache_data
+# Nombre de véhicules affichés par page de recommandations
+PAGE_SIZE = 10
+
+@st.cache_resource
+def experience_store():
+    """Magasin des expériences partagé par les sessions (mis à jour par ajouts)"""
+    return ExperienceStore()
+
 def load_data():
-    """Charger les données d'expérience depuis l'URL"""
+    """Charger les données d'expérience (instantané local revalidé en arrière-plan)
+
+    Seules les lignes ajoutées depuis la dernière version sont lues et
+    fusionnées dans les agrégats par modèle, hors du chemin des requêtes.
+    """
     try:
-        df = pd.read_csv('https://30veli.fabmob.io/cache/30veli_export_experiences.csv')
-        df['Model'] = df['Model'].fillna(df['vehicule'])
-        df = df[df['Model'].notna()]
-        return df
+        with METRICS.stage("load_data"):
+            return experience_store().current()
     except Exception as e:
         st.error(f"Erreur lors du chargement des données d'expérience : {e}")
         return None
 
-@st.cache_data(ttl=60)  # Cache de 60 secondes seulement
+@st.cache_resource
+def catalogue_store():
+    """Catalogue partagé par les sessions (rechargé en arrière-plan)"""
+    return CatalogueStore()
+
+@st.cache_resource
+def background_refresher():
+    """Rechargements périodiques et à la demande des expériences et du catalogue"""
+    return BackgroundRefresher([
+        ("expériences", experience_store().refresh),
+        ("catalogue", catalogue_store().reload)
+    ]).start()
+
+@st.cache_resource
+def recommendation_cache():
+    """Cache des recommandations partagé par les sessions"""
+    cache = RecommendationCache()
+    METRICS.watch_cache("recommandations", cache)
+    return cache
+
+@st.cache_resource
+def load_lattice(catalogue_version, _catalogue):
+    """Treillis des recommandations pour toutes les combinaisons de critères"""
+    from lattice import CriteriaLattice
+    return CriteriaLattice(_catalogue)
+
+@st.cache_resource
+def load_bitsets(catalogue_version, _catalogue):
+    """Caractéristiques du catalogue en ensembles de bits (assouplissements)"""
+    from relaxation import CriteriaBitsets
+    return CriteriaBitsets(_catalogue.matrices)
+
+@st.cache_resource
+def export_cache():
+    """Fichiers d'export partagés par les sessions, produits à la demande"""
+    from exports import ExportCache
+    return ExportCache()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def statistics_charts(data_version, models, months, _cube):
+    """Figures de l'onglet Statistiques (spécifications Plotly)
+
+    Calculées sur le cube des trajets et mémorisées par version des données
+    et par filtre : un rerun sans changement ne reconstruit aucune figure.
+    """
+    METRICS.miss("graphiques")
+    with STARTUP.stage("import plotly"):
+        import plotly.express as px
+    cube = _cube.filter(models, months)
+    vehicle_counts = cube.trips_per_model()
+    bilan_counts = cube.bilan_distribution()
+    month_counts = cube.trips_per_month()
+    charts = {
+        'vehicles': px.bar(
+            x=vehicle_counts.index,
+            y=vehicle_counts.values,
+            labels={'x': 'Véhicule', 'y': 'Nombre de trajets'},
+            title="Répartition des trajets par véhicule"
+        ),
+        'bilans': px.pie(
+            values=bilan_counts.values,
+            names=bilan_counts.index,
+            title="Répartition des bilans",
+            color_discrete_sequence=['green', 'lightgreen', 'orange', 'red']
+        )
+    }
+    if len(month_counts):
+        charts['months'] = px.bar(
+            x=month_counts.index,
+            y=month_counts.values,
+            labels={'x': 'Mois', 'y': 'Nombre de trajets'},
+            title="Trajets par mois"
+        )
+    return {name: fig.to_dict() for name, fig in charts.items()}
+
 def load_vehicules_specs():
-    """Charger les caractéristiques des véhicules depuis le fichier Excel"""
+    """Charger les caractéristiques des véhicules depuis le fichier Excel
+
+    Le catalogue est servi depuis l'artefact compilé, sans copie entre les
+    sessions ; un classeur modifié est recompilé en arrière-plan.
+    """
     try:
         # Tenter de charger depuis le fichier uploadé par l'utilisateur
-        df = pd.read_excel('30veli_caracteristiques_vehicules.xlsx', sheet_name='Caractéristiques Véhicules')
-        st.sidebar.success(f"✅ Fichier chargé : {len(df)} véhicules")
-        return df
+        # (le schéma des colonnes est résolu et validé une seule fois ici)
+        catalogue = catalogue_store().current()
+        st.sidebar.success(f"✅ Fichier chargé : {len(catalogue)} véhicules")
+        return catalogue
     except Exception as e:
         st.sidebar.error(f"❌ Erreur chargement : {e}")
         # Si le fichier n'existe pas encore, retourner None
         return None
 
-def check_vehicle_match(vehicle_row, criteria):
-    """Vérifier si un véhicule correspond aux critères"""
-    score = 100
-    matches = []
-    mismatches = []
-    
-    def is_positive(value):
-        """Vérifier si une valeur est positive (OUI, X, ou oui/x en minuscule)"""
-        return str(value).upper().strip() in ['OUI', 'X']
-    
-    # Critère : Pédaler
-    if 'pedaler' in criteria and criteria['pedaler'] is not None:
-        # Chercher la colonne pédalage (avec ou sans /X)
-        pedaler_col = None
-        for col in vehicle_row.index:
-            if 'pédaler' in col.lower() and ('oui' in col.lower() or 'non' in col.lower()):
-                pedaler_col = col
-                break
-        
-        if pedaler_col:
-            vehicle_pedaler_value = vehicle_row.get(pedaler_col, '')
-            vehicle_pedaler = is_positive(vehicle_pedaler_value)
-            
-            if criteria['pedaler'] == 'OUI' and vehicle_pedaler:
-                matches.append("✅ Nécessite de pédaler")
-            elif criteria['pedaler'] == 'NON' and not vehicle_pedaler:
-                matches.append("✅ Pas besoin de pédaler")
-            elif str(vehicle_pedaler_value).strip():  # Si une valeur existe
-                mismatches.append(f"❌ Pédaler : {'requis' if vehicle_pedaler else 'non requis'}")
-                score -= 20
-    
-    # Critère : Passagers enfants (ignorer si 0)
-    if 'nb_enfants' in criteria and criteria['nb_enfants'] is not None and criteria['nb_enfants'] > 0:
-        col_name = f"Passagers enfants - {criteria['nb_enfants']}"
-        if col_name in vehicle_row.index:
-            if is_positive(vehicle_row[col_name]):
-                matches.append(f"✅ Peut transporter {criteria['nb_enfants']} enfant(s)")
-            else:
-                mismatches.append(f"❌ Ne peut pas transporter {criteria['nb_enfants']} enfant(s)")
-                score -= 25
-    
-    # Critère : Passagers adultes (ignorer si 0)
-    if 'nb_adultes' in criteria and criteria['nb_adultes'] is not None and criteria['nb_adultes'] > 0:
-        col_name = f"Passagers adultes - {criteria['nb_adultes']}"
-        if col_name in vehicle_row.index:
-            if is_positive(vehicle_row[col_name]):
-                matches.append(f"✅ Peut transporter {criteria['nb_adultes']} adulte(s)")
-            else:
-                mismatches.append(f"❌ Ne peut pas transporter {criteria['nb_adultes']} adulte(s)")
-                score -= 25
-    
-    # Critère : Chargement
-    if 'chargement' in criteria and criteria['chargement']:
-        chargement_map = {
-            "Petit sac (< 5kg)": "Chargement - Petit sac (< 5kg)",
-            "Sacs courses semaine (10-30kg)": "Chargement - Sacs courses semaine (10-30kg)",
-            "Charges lourdes (> 100kg)": "Chargement - Charges lourdes (> 100kg)"
-        }
-        col_name = chargement_map.get(criteria['chargement'])
-        if col_name and col_name in vehicle_row.index:
-            if is_positive(vehicle_row[col_name]):
-                matches.append(f"✅ Capacité de chargement : {criteria['chargement']}")
-            else:
-                mismatches.append(f"❌ Capacité de chargement insuffisante")
-                score -= 20
-    
-    # Critère : Couverture
-    if 'couverture' in criteria and criteria['couverture']:
-        if criteria['couverture'] == "Totalement couvert":
-            # Chercher la colonne "Totalement couvert"
-            col = None
-            for c in vehicle_row.index:
-                if 'totalement' in c.lower() and 'couvert' in c.lower():
-                    col = c
-                    break
-            if col and is_positive(vehicle_row.get(col, '')):
-                matches.append("✅ Totalement couvert")
-            else:
-                mismatches.append("❌ Pas totalement couvert")
-                score -= 15
-        elif criteria['couverture'] == "Partiellement couvert":
-            # Chercher la colonne "Partiellement couvert"
-            col = None
-            for c in vehicle_row.index:
-                if 'partiellement' in c.lower() and 'couvert' in c.lower():
-                    col = c
-                    break
-            if col and is_positive(vehicle_row.get(col, '')):
-                matches.append("✅ Partiellement couvert")
-            else:
-                mismatches.append("⚠️ Couverture différente")
-                score -= 10
-    
-    # Critère : Territoire
-    if 'territoire' in criteria and criteria['territoire']:
-        terrain_keywords = {
-            "Plutôt plat": ["plat"],
-            "Vallonné": ["vallonné", "vallonn"],
-            "Montagneux": ["montagneux", "montagne"]
-        }
-        keywords = terrain_keywords.get(criteria['territoire'], [])
-        
-        # Chercher la colonne correspondante
-        col = None
-        for c in vehicle_row.index:
-            if 'terrain' in c.lower() or 'adapté' in c.lower():
-                if any(kw in c.lower() for kw in keywords):
-                    col = c
-                    break
-        
-        if col:
-            if is_positive(vehicle_row[col]):
-                matches.append(f"✅ Adapté terrain {criteria['territoire'].lower()}")
-            else:
-                mismatches.append(f"❌ Pas adapté terrain {criteria['territoire'].lower()}")
-                score -= 20
-    
-    # Déterminer si le véhicule est compatible (éliminatoire)
-    # Un véhicule est incompatible si :
-    # - Il ne peut pas transporter le nombre de passagers demandé (critère éliminatoire)
-    # - Le pédalage ne correspond pas (critère éliminatoire)
-    
-    is_compatible = True
-    
-    # Vérifier critères éliminatoires
-    if 'nb_enfants' in criteria and criteria['nb_enfants'] is not None and criteria['nb_enfants'] > 0:
-        col_name = f"Passagers enfants - {criteria['nb_enfants']}"
-        if col_name in vehicle_row.index and not is_positive(vehicle_row[col_name]):
-            is_compatible = False
-    
-    if 'nb_adultes' in criteria and criteria['nb_adultes'] is not None and criteria['nb_adultes'] > 0:
-        col_name = f"Passagers adultes - {criteria['nb_adultes']}"
-        if col_name in vehicle_row.index and not is_positive(vehicle_row[col_name]):
-            is_compatible = False
-    
-    if 'pedaler' in criteria and criteria['pedaler'] is not None:
-        # Chercher la colonne pédalage (avec ou sans /X)
-        pedaler_col = None
-        for col in vehicle_row.index:
-            if 'pédaler' in col.lower() and ('oui' in col.lower() or 'non' in col.lower()):
-                pedaler_col = col
-                break
-        
-        if pedaler_col:
-            vehicle_pedaler_value = vehicle_row.get(pedaler_col, '')
-            vehicle_pedaler = is_positive(vehicle_pedaler_value)
-            if str(vehicle_pedaler_value).strip():  # Si une valeur existe
-                if (criteria['pedaler'] == 'OUI' and not vehicle_pedaler) or \
-                   (criteria['pedaler'] == 'NON' and vehicle_pedaler):
-                    is_compatible = False
-    
-    return max(0, score), matches, mismatches, is_compatible
-
-def display_vehicle_recommendation(vehicle_name, vehicle_specs, experience_data, score, matches, mismatches, rank=None):
-    """Afficher une recommandation de véhicule avec toutes les infos"""
+def display_vehicle_recommendation(vehicle_name, index, vehicle_specs, experience_data, score, matches, mismatches, schema, rank=None):
+    """Afficher une recommandation de véhicule avec toutes les infos (index : ligne du catalogue)"""
     
     # Afficher le rang si fourni
     if rank:
@@ -250,8 +198,8 @@ def display_vehicle_recommendation(vehicle_name, vehicle_specs, experience_data,
     
     with col1:
         st.markdown("**📋 Caractéristiques**")
-        vitesse = vehicle_specs.get('Vitesse max (km/h)', 'N/A')
-        autonomie = vehicle_specs.get('Autonomie (km)', 'N/A')
+        vitesse = vehicle_specs.get(schema.vitesse, 'N/A')
+        autonomie = vehicle_specs.get(schema.autonomie, 'N/A')
         st.write(f"🏎️ Vitesse max : {vitesse} km/h")
         st.write(f"🔋 Autonomie : {autonomie} km")
     
@@ -273,48 +221,96 @@ def display_vehicle_recommendation(vehicle_name, vehicle_specs, experience_data,
     
     # Retours d'expérience
     if experience_data is not None and len(experience_data) > 0:
-        df_vehicle = experience_data[experience_data['Model'] == vehicle_name]
-        if len(df_vehicle) > 0:
-            with st.expander(f"📊 Retours d'expérience ({len(df_vehicle)} trajets)"):
-                # Satisfaction
-                bilan_counts = df_vehicle['bilan'].value_counts()
-                satisfaction = (
-                    bilan_counts.get('Très positif', 0) * 1.0 +
-                    bilan_counts.get('Positif', 0) * 0.7
-                ) / len(df_vehicle) * 100 if len(df_vehicle) > 0 else 0
-                
-                st.metric("Taux de satisfaction", f"{satisfaction:.0f}%")
+        stats = experience_data.model_stats(vehicle_name)
+        if stats is not None:
+            # Contenu calculé et envoyé uniquement quand l'expander est ouvert
+            expander = st.expander(
+                f"📊 Retours d'expérience ({stats['trips']} trajets)",
+                key=f"retours_{index}",
+                on_change="rerun"
+            )
+            if expander.open:
+                with expander:
+                    # Satisfaction
+                    st.metric("Taux de satisfaction", f"{stats['satisfaction']:.0f}%")
                 
-                # Commentaires
-                commentaires = df_vehicle[df_vehicle['commentaires'].notna()]['commentaires'].head(3).tolist()
-                if commentaires:
-                    st.markdown("**Derniers retours :**")
-                    for i, comment in enumerate(commentaires, 1):
-                        st.write(f"{i}. _{comment[:150]}{'...' if len(comment) > 150 else ''}_")
+                    # Commentaires
+                    commentaires = stats['comments']
+                    if commentaires:
+                        st.markdown("**Derniers retours :**")
+                        for i, comment in enumerate(commentaires, 1):
+                            st.write(f"{i}. _{comment[:150]}{'...' if len(comment) > 150 else ''}_")
     
     # Remarques du fabricant
-    remarques = vehicle_specs.get('Remarques', '')
+    remarques = vehicle_specs.get(schema.remarques, '') if schema.remarques else ''
     if remarques and str(remarques) != 'nan':
         st.info(f"💡 **Remarque :** {remarques}")
     
     st.markdown("---")
 
+def show_more_recommendations():
+    """Afficher la page suivante de recommandations"""
+    st.session_state['nb_affiches'] += PAGE_SIZE
+
+def export_button(label, file_name, build, key):
+    """Choix du format et bouton de téléchargement ; le fichier n'est produit qu'au clic
+
+    build(format) retourne le chemin de l'export (voir exports.ExportCache).
+    Streamlit transmet les données d'un téléchargement en un bloc : le fichier
+    est lu en entier au clic (seul service.py l'envoie par morceaux).
+    """
+    from exports import FORMATS
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox(
+            "Format", list(FORMATS), format_func=lambda f: FORMATS[f][2],
+            key=f"{key}_format", label_visibility="collapsed"
+        )
+    extension, mime, _ = FORMATS[fmt]
+    
+    def data():
+        with open(build(fmt), 'rb') as f:
+            return f.read()
+    
+    with col2:
+        st.download_button(label, data=data, file_name=f"{file_name}.{extension}", mime=mime, key=key)
+
+def highlighted(parts):
+    """Extrait de commentaire en HTML, mots trouvés surlignés"""
+    return "".join(
+        f"<mark>{html.escape(text)}</mark>" if match else html.escape(text)
+        for text, match in parts
+    )
+
+def apply_relaxation(changes):
+    """Reporter un assouplissement dans les critères de la barre latérale"""
+    for field, _, after in changes:
+        if field == 'pedaler':
+            st.session_state['pedaler'] = PEDALER_OPTIONS[0]
+        else:
+            st.session_state[field] = after
+
 # Interface principale
-def main():
+def render_page():
+    """En-tête, barre latérale et onglets"""
     st.markdown('<p class="main-header">🚗 30VELI - Conseiller Véhicules v3</p>', unsafe_allow_html=True)
     st.markdown("### Trouvez le véhicule parfait selon vos besoins précis")
     
-    # Charger les données
-    experience_data = load_data()
-    vehicules_specs = load_vehicules_specs()
+    # Charger les caractéristiques (les expériences ne sont chargées que par
+    # les onglets qui les affichent)
+    with STARTUP.stage("catalogue"), METRICS.stage("load_vehicules_specs"):
+        catalogue = load_vehicules_specs()
+    refresher = background_refresher()
     
     # Bouton pour forcer le rechargement (sidebar)
     if st.sidebar.button("🔄 Recharger les données"):
-        st.cache_data.clear()
-        st.rerun()
+        # Les données sont rechargées en arrière-plan : la version actuelle
+        # reste affichée jusqu'à ce que la nouvelle soit prête
+        refresher.trigger()
+        st.toast("🔄 Rechargement lancé en arrière-plan")
     
     # Vérifier si le fichier de specs existe
-    if vehicules_specs is None:
+    if catalogue is None:
         st.warning("⚠️ **Fichier de caractéristiques manquant**")
         st.info("""
         Pour utiliser cette version améliorée du dashboard, vous devez :
@@ -340,6 +336,19 @@ def main():
         
         return
     
+    vehicules_specs = catalogue.specs
+    schema = catalogue.schema
+    
+    # Treillis précalculé (optionnel) : chaque requête devient une lecture
+    lattice = None
+    if PRECOMPUTE_LATTICE:
+        with STARTUP.stage("treillis"):
+            lattice = load_lattice(catalogue.version, catalogue)
+        st.sidebar.caption(
+            f"⚡ {lattice.n_cells} combinaisons précalculées en "
+            f"{lattice.build_seconds * 1000:.0f} ms ({lattice.nbytes / 1e6:.1f} Mo)"
+        )
+    
     # Sidebar avec les nouveaux critères
     st.sidebar.header("🎯 Vos critères détaillés")
     
@@ -347,8 +356,9 @@ def main():
     st.sidebar.markdown("### 💪 Effort physique")
     pedaler = st.sidebar.radio(
         "Souhaitez-vous pédaler ?",
-        ["Indifférent", "Oui, je veux pédaler", "Non, sans effort"],
-        index=0
+        PEDALER_OPTIONS,
+        index=0,
+        key="pedaler"
     )
     
     # 2. Transport de passagers
@@ -356,26 +366,23 @@ def main():
     
     nb_enfants = st.sidebar.selectbox(
         "Nombre d'enfants à transporter",
-        [0, 1, 2, 3, 4],
-        index=0
+        NB_ENFANTS_OPTIONS,
+        index=0,
+        key="nb_enfants"
     )
     
     nb_adultes = st.sidebar.selectbox(
         "Nombre d'adultes à transporter (en plus du conducteur)",
-        [0, 1, 2, 3],
-        index=0
+        NB_ADULTES_OPTIONS,
+        index=0,
+        key="nb_adultes"
     )
     
     # 3. Capacité de chargement
     st.sidebar.markdown("### 📦 Capacité de chargement")
     chargement = st.sidebar.selectbox(
         "Type de chargement",
-        [
-            "Aucun besoin spécifique",
-            "Petit sac (< 5kg)",
-            "Sacs courses semaine (10-30kg)",
-            "Charges lourdes (> 100kg)"
-        ],
+        CHARGEMENT_CHOICES,
         index=0
     )
     
@@ -383,7 +390,7 @@ def main():
     st.sidebar.markdown("### ☔ Protection météo")
     couverture = st.sidebar.selectbox(
         "Couverture souhaitée",
-        ["Indifférent", "Totalement couvert", "Partiellement couvert", "Non couvert"],
+        COUVERTURE_OPTIONS,
         index=0
     )
     
@@ -391,7 +398,7 @@ def main():
     st.sidebar.markdown("### 🗺️ Type de terrain")
     territoire = st.sidebar.selectbox(
         "Relief habituel",
-        ["Indifférent", "Plutôt plat", "Vallonné", "Montagneux"],
+        TERRITOIRE_OPTIONS,
         index=0
     )
     
@@ -399,14 +406,14 @@ def main():
     st.sidebar.markdown("### 🎯 Cas d'usage")
     cas_usage = st.sidebar.multiselect(
         "Type d'utilisation (optionnel)",
-        ["Domicile-Travail", "Courses", "Loisirs", "Médical", "École"]
+        CAS_USAGE_OPTIONS
     )
     
     # 7. Vitesse max et tri
     st.sidebar.markdown("### 🏎️ Tri des résultats")
     tri_par = st.sidebar.selectbox(
         "Trier par",
-        ["Score de compatibilité", "Vitesse max", "Autonomie"],
+        SORT_OPTIONS,
         index=0
     )
     
@@ -414,170 +421,337 @@ def main():
     rechercher = st.sidebar.button("🔍 Trouver les véhicules adaptés", type="primary")
     
     # Construire le dictionnaire de critères
-    criteria = {
-        'pedaler': 'OUI' if 'Oui' in pedaler else ('NON' if 'Non' in pedaler else None),
-        'nb_enfants': nb_enfants,
-        'nb_adultes': nb_adultes,
-        'chargement': chargement if chargement != "Aucun besoin spécifique" else None,
-        'couverture': couverture if couverture != "Indifférent" else None,
-        'territoire': territoire if territoire != "Indifférent" else None,
-        'cas_usage': cas_usage
-    }
+    criteria = build_criteria(pedaler, nb_enfants, nb_adultes, chargement, couverture, territoire, cas_usage)
     
-    # Tabs
-    tab1, tab2, tab3 = st.tabs(["🏆 Recommandations", "📊 Tous les véhicules", "📈 Statistiques"])
+    # Tabs : seul l'onglet affiché est exécuté
+    tab1, tab2, tab3, tab4 = st.tabs(
+        ["🏆 Recommandations", "📊 Tous les véhicules", "📈 Statistiques", "💬 Retours d'expérience"],
+        key="onglet",
+        on_change="rerun"
+    )
     
-    with tab1:
-        st.markdown("## Véhicules recommandés pour vous")
-        
-        # Afficher les critères sélectionnés
-        criteres_actifs = []
-        if criteria['pedaler']:
-            criteres_actifs.append(f"💪 {'Avec' if criteria['pedaler']=='OUI' else 'Sans'} pédalage")
-        if criteria['nb_enfants'] > 0:
-            criteres_actifs.append(f"👶 {criteria['nb_enfants']} enfant(s)")
-        if criteria['nb_adultes'] > 0:
-            criteres_actifs.append(f"👥 {criteria['nb_adultes']} adulte(s)")
-        if criteria['chargement']:
-            criteres_actifs.append(f"📦 {criteria['chargement']}")
-        if criteria['couverture']:
-            criteres_actifs.append(f"☔ {criteria['couverture']}")
-        if criteria['territoire']:
-            criteres_actifs.append(f"🗺️ Terrain {criteria['territoire'].lower()}")
-        
-        if criteres_actifs:
-            st.info("**Critères sélectionnés :** " + " • ".join(criteres_actifs))
-        
-        if rechercher or len(criteres_actifs) > 0:
-            # Analyser chaque véhicule
-            recommendations = []
-            filtered_out = []
+    if tab1.open:
+        with tab1:
+            st.markdown("## Véhicules recommandés pour vous")
             
-            for idx, vehicle_row in vehicules_specs.iterrows():
-                vehicle_name = vehicle_row['Véhicule']
-                score, matches, mismatches, is_compatible = check_vehicle_match(vehicle_row, criteria)
-                
-                if is_compatible:
-                    recommendations.append((vehicle_name, score, matches, mismatches, vehicle_row))
-                else:
-                    filtered_out.append((vehicle_name, mismatches))
+            # Afficher les critères sélectionnés
+            criteres_actifs = []
+            if criteria['pedaler']:
+                criteres_actifs.append(f"💪 {'Avec' if criteria['pedaler']=='OUI' else 'Sans'} pédalage")
+            if criteria['nb_enfants'] > 0:
+                criteres_actifs.append(f"👶 {criteria['nb_enfants']} enfant(s)")
+            if criteria['nb_adultes'] > 0:
+                criteres_actifs.append(f"👥 {criteria['nb_adultes']} adulte(s)")
+            if criteria['chargement']:
+                criteres_actifs.append(f"📦 {criteria['chargement']}")
+            if criteria['couverture']:
+                criteres_actifs.append(f"☔ {criteria['couverture']}")
+            if criteria['territoire']:
+                criteres_actifs.append(f"🗺️ Terrain {criteria['territoire'].lower()}")
             
-            # Trier selon le critère choisi
-            if tri_par == "Vitesse max":
-                recommendations.sort(key=lambda x: float(x[4].get('Vitesse max (km/h)', 0) or 0), reverse=True)
-            elif tri_par == "Autonomie":
-                recommendations.sort(key=lambda x: float(x[4].get('Autonomie (km)', 0) or 0), reverse=True)
-            else:  # Score de compatibilité
-                recommendations.sort(key=lambda x: x[1], reverse=True)
+            if criteres_actifs:
+                st.info("**Critères sélectionnés :** " + " • ".join(criteres_actifs))
             
-            if recommendations:
-                # Afficher le nombre de véhicules filtrés
-                if filtered_out:
-                    with st.expander(f"ℹ️ {len(filtered_out)} véhicule(s) non compatible(s) masqué(s)"):
-                        st.markdown("**Ces véhicules ne correspondent pas à vos critères essentiels :**")
-                        for vehicle_name, reasons in filtered_out:
-                            st.markdown(f"**{vehicle_name}**")
-                            for reason in reasons[:3]:  # Afficher max 3 raisons
-                                st.markdown(f"  {reason}")
-                            st.markdown("")
+            if rechercher or len(criteres_actifs) > 0:
+                with STARTUP.stage("expériences"):
+                    experience_data = load_data()
                 
-                # Tous les véhicules compatibles (sans séparation Top 3)
-                st.markdown(f"### 📋 Véhicules compatibles ({len(recommendations)})")
-                st.markdown(f"*Triés par : {tri_par}*")
+                # Analyser tout le catalogue (résultats mémorisés par critères ;
+                # seule la page affichée est triée, par sélection partielle)
+                data_version = experience_data.version if experience_data is not None else None
                 
-                for i, (vehicle_name, score, matches, mismatches, vehicle_specs) in enumerate(recommendations, 1):
-                    with st.container():
-                        display_vehicle_recommendation(
-                            vehicle_name, vehicle_specs, experience_data, 
-                            score, matches, mismatches, rank=f"{i}."
-                        )
-            else:
-                st.warning("😕 Aucun véhicule ne correspond à vos critères")
+                def full_result():
+                    return recommendation_cache().get(
+                        catalogue, criteria, data_version, lattice=lattice, experience=experience_data
+                    )
+                
+                with STARTUP.stage("recommandations"), METRICS.stage("recommend"):
+                    # Avec le treillis, seuls les véhicules affichés sont construits
+                    result = None
+                    if lattice is not None and lattice.version == catalogue.version and tri_par in lattice.rankings:
+                        result = lattice.view(criteria)
+                    if result is None:
+                        result = full_result()
                 
-                if filtered_out:
-                    st.info(f"""
-                    **{len(filtered_out)} véhicule(s) ont été écartés** car ils ne remplissent pas vos critères essentiels :
+                # Pagination : revenir à la première page quand la requête change
+                page_key = (criteria_key(criteria), tri_par)
+                if st.session_state.get('page_key') != page_key:
+                    st.session_state['page_key'] = page_key
+                    st.session_state['nb_affiches'] = PAGE_SIZE
+                nb_affiches = st.session_state['nb_affiches']
+                
+                if len(result) > 0:
+                    # Afficher le nombre de véhicules filtrés
+                    if result.n_filtered_out:
+                        expander = st.expander(
+                            f"ℹ️ {result.n_filtered_out} véhicule(s) non compatible(s) masqué(s)",
+                            key="non_compatibles",
+                            on_change="rerun"
+                        )
+                        if expander.open:
+                            with expander:
+                                st.markdown("**Ces véhicules ne correspondent pas à vos critères essentiels :**")
+                                for vehicle_name, reasons in result.filtered_out:
+                                    st.markdown(f"**{vehicle_name}**")
+                                    for reason in reasons[:3]:  # Afficher max 3 raisons
+                                        st.markdown(f"  {reason}")
+                                    st.markdown("")
+                    
+                    # Tous les véhicules compatibles (sans séparation Top 3)
+                    st.markdown(f"### 📋 Véhicules compatibles ({len(result)})")
+                    st.markdown(f"*Triés par : {tri_par}*")
+                    if tri_par == EXPERIENCE_SORT:
+                        st.caption(
+                            f"Score de compatibilité ({1 - EXPERIENCE_WEIGHT:.0%}) et retours d'expérience "
+                            f"({EXPERIENCE_WEIGHT:.0%}) : satisfaction et distance moyenne, d'autant plus "
+                            "prises en compte que le modèle compte de trajets"
+                        )
                     
-                    - Capacité de transport de passagers
-                    - Besoin de pédaler ou non
+                    # Seuls les premiers véhicules sont sélectionnés (tri partiel) et rendus
+                    with METRICS.stage("sort"):
+                        ranked = result.top(tri_par, nb_affiches)
+                    for i, reco in enumerate(ranked, 1):
+                        with st.container(), METRICS.stage("display_vehicle_recommendation"):
+                            display_vehicle_recommendation(
+                                reco.name, reco.index, vehicules_specs.iloc[reco.index], experience_data, 
+                                reco.score, reco.matches, reco.mismatches, schema, rank=f"{i}."
+                            )
                     
-                    💡 **Suggestions :**
-                    - Assouplissez vos critères (ex: accepter de pédaler)
-                    - Réduisez le nombre de passagers
-                    - Changez le type de chargement
-                    """)
+                    restants = len(result) - nb_affiches
+                    if restants > 0:
+                        st.button(
+                            f"⬇️ Afficher plus de véhicules ({restants} restant(s))",
+                            on_click=show_more_recommendations
+                        )
                     
-                    with st.expander("Voir les véhicules non compatibles"):
-                        for vehicle_name, reasons in filtered_out:
-                            st.markdown(f"**{vehicle_name}**")
-                            for reason in reasons:
-                                st.markdown(f"  {reason}")
-                            st.markdown("")
+                    # Classement complet avec les raisons (véhicules écartés compris)
+                    export_button(
+                        "📥 Exporter le classement", '30veli_recommandations',
+                        lambda fmt: export_cache().recommendations(
+                            catalogue, full_result(), criteria, tri_par, data_version, fmt
+                        ),
+                        key="export_recommandations"
+                    )
                 else:
-                    st.info("Aucun véhicule dans la base de données. Vérifiez que le fichier Excel est bien rempli.")
-        else:
-            st.info("👈 Sélectionnez vos critères dans le menu de gauche et cliquez sur 'Trouver les véhicules adaptés'")
+                    st.warning("😕 Aucun véhicule ne correspond à vos critères")
+                    
+                    if result.n_filtered_out:
+                        from relaxation import near_misses, relaxations
+                        
+                        st.info(
+                            f"**{result.n_filtered_out} véhicule(s) ont été écartés** car ils ne remplissent pas "
+                            "vos critères essentiels (passagers, pédalage)."
+                        )
+                        
+                        # Assouplissements minimaux et véhicules les plus proches,
+                        # calculés sur les ensembles de bits du catalogue
+                        with METRICS.stage("relaxations"):
+                            bitsets = load_bitsets(catalogue.version, catalogue)
+                            suggestions = relaxations(bitsets, criteria)
+                            proches = near_misses(bitsets, criteria)
+                        
+                        if suggestions:
+                            st.markdown("#### 💡 En assouplissant vos critères")
+                            for i, relaxation in enumerate(suggestions):
+                                col1, col2 = st.columns([4, 1])
+                                with col1:
+                                    apercu = ", ".join(relaxation.vehicles[:3])
+                                    if len(relaxation.vehicles) > 3:
+                                        apercu += ", …"
+                                    st.markdown(
+                                        f"**{relaxation.describe().capitalize()}** : "
+                                        f"{len(relaxation.vehicles)} véhicule(s) ({apercu})"
+                                    )
+                                with col2:
+                                    st.button(
+                                        "Appliquer",
+                                        key=f"assouplir_{i}",
+                                        on_click=apply_relaxation,
+                                        args=(relaxation.changes,)
+                                    )
+                        
+                        if proches:
+                            st.markdown("#### 🔎 Véhicules les plus proches")
+                            for proche in proches:
+                                st.markdown(
+                                    f"**{proche.name}** (score {proche.score}/100) : "
+                                    + " • ".join(proche.unmet)
+                                )
+                        
+                        expander = st.expander(
+                            "Voir les véhicules non compatibles",
+                            key="non_compatibles_detail",
+                            on_change="rerun"
+                        )
+                        if expander.open:
+                            with expander:
+                                for vehicle_name, reasons in result.filtered_out:
+                                    st.markdown(f"**{vehicle_name}**")
+                                    for reason in reasons:
+                                        st.markdown(f"  {reason}")
+                                    st.markdown("")
+                    else:
+                        st.info("Aucun véhicule dans la base de données. Vérifiez que le fichier Excel est bien rempli.")
+            else:
+                st.info("👈 Sélectionnez vos critères dans le menu de gauche et cliquez sur 'Trouver les véhicules adaptés'")
     
-    with tab2:
-        st.markdown("## Catalogue complet des véhicules")
-        
-        if vehicules_specs is not None:
-            # Afficher le tableau
-            st.dataframe(vehicules_specs, use_container_width=True, height=400)
+    if tab2.open:
+        with tab2:
+            st.markdown("## Catalogue complet des véhicules")
             
-            # Permettre le téléchargement
-            st.download_button(
-                label="📥 Télécharger le tableau complet (CSV)",
-                data=vehicules_specs.to_csv(index=False).encode('utf-8'),
-                file_name='30veli_vehicules.csv',
-                mime='text/csv',
-            )
+            if vehicules_specs is not None:
+                # Afficher le tableau
+                st.dataframe(vehicules_specs, use_container_width=True, height=400)
+                
+                # Téléchargement : fichier produit au clic, gardé par version du catalogue
+                export_button(
+                    "📥 Télécharger le tableau complet", '30veli_vehicules',
+                    lambda fmt: export_cache().catalogue(catalogue, fmt), key="export_catalogue"
+                )
     
-    with tab3:
-        st.markdown("## Statistiques d'utilisation")
-        
-        if experience_data is not None:
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Véhicules testés", len(vehicules_specs))
+    if tab3.open:
+        with tab3:
+            st.markdown("## Statistiques d'utilisation")
             
-            with col2:
-                st.metric("Trajets recensés", len(experience_data))
+            with STARTUP.stage("expériences"):
+                experience_data = load_data()
             
-            with col3:
-                avg_satisfaction = (
-                    experience_data['bilan'].value_counts(normalize=True).get('Très positif', 0) +
-                    experience_data['bilan'].value_counts(normalize=True).get('Positif', 0) * 0.7
+            if experience_data is not None:
+                cube = experience_data.cube
+                
+                # Filtres (appliqués au cube, sans relire les trajets)
+                col1, col2 = st.columns(2)
+                with col1:
+                    selected_models = st.multiselect(
+                        "Véhicules", cube.models(), key="stats_models", placeholder="Tous les véhicules"
+                    )
+                months = cube.months()
+                period = None
+                if len(months) > 1:
+                    with col2:
+                        start, end = st.select_slider(
+                            "Période", options=months, value=(months[0], months[-1]), key="stats_period"
+                        )
+                    if (start, end) != (months[0], months[-1]):
+                        period = tuple(month for month in months if start <= month <= end)
+                models = tuple(selected_models) or None
+                filtered = cube.filter(models, period)
+                
+                col1, col2, col3, col4 = st.columns(4)
+                
+                with col1:
+                    st.metric("Véhicules testés", len(vehicules_specs))
+                
+                with col2:
+                    st.metric("Trajets recensés", filtered.total_trips())
+                
+                with col3:
+                    distribution = filtered.bilan_distribution()
+                    avg_satisfaction = satisfaction_rate(distribution, distribution.sum())
+                    st.metric("Satisfaction moyenne", f"{avg_satisfaction:.0f}%")
+                
+                with col4:
+                    st.metric("Distance totale", f"{filtered.total_distance():.0f} km")
+                
+                # Graphiques
+                with STARTUP.stage("graphiques"), METRICS.stage("graphiques"):
+                    METRICS.lookup("graphiques")
+                    with METRICS.stage("statistics_charts"):
+                        charts = statistics_charts(experience_data.version, models, period, cube)
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        st.plotly_chart(charts['vehicles'], use_container_width=True)
+                    
+                    with col2:
+                        st.plotly_chart(charts['bilans'], use_container_width=True)
+                    
+                    if 'months' in charts:
+                        st.plotly_chart(charts['months'], use_container_width=True)
+                
+                export_button(
+                    "📥 Exporter les agrégats par modèle", '30veli_agregats',
+                    lambda fmt: export_cache().aggregates(experience_data, fmt), key="export_agregats"
                 )
-                st.metric("Satisfaction moyenne", f"{avg_satisfaction*100:.0f}%")
-            
-            with col4:
-                total_distance = experience_data['totalDistanceKm'].sum()
-                st.metric("Distance totale", f"{total_distance:.0f} km")
-            
-            # Graphiques
-            col1, col2 = st.columns(2)
+    
+    if tab4.open:
+        with tab4:
+            st.markdown("## Rechercher dans les retours d'expérience")
             
-            with col1:
-                vehicle_counts = experience_data['Model'].value_counts()
-                fig = px.bar(
-                    x=vehicle_counts.index,
-                    y=vehicle_counts.values,
-                    labels={'x': 'Véhicule', 'y': 'Nombre de trajets'},
-                    title="Répartition des trajets par véhicule"
-                )
-                st.plotly_chart(fig, use_container_width=True)
+            with STARTUP.stage("expériences"):
+                experience_data = load_data()
             
-            with col2:
-                bilan_counts = experience_data['bilan'].value_counts()
-                fig = px.pie(
-                    values=bilan_counts.values,
-                    names=bilan_counts.index,
-                    title="Répartition des bilans",
-                    color_discrete_sequence=['green', 'lightgreen', 'orange', 'red']
-                )
-                st.plotly_chart(fig, use_container_width=True)
+            if experience_data is not None:
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    recherche = st.text_input(
+                        "Mots recherchés", key="recherche_commentaires",
+                        placeholder="ex : pluie, côte, enfants…"
+                    )
+                with col2:
+                    modele = st.selectbox(
+                        "Véhicule", ["Tous les véhicules"] + sorted(experience_data.by_model.index),
+                        key="recherche_modele"
+                    )
+                
+                if recherche.strip():
+                    # Index inversé partagé par les sessions, complété au fil des ajouts
+                    with METRICS.stage("comment_search"):
+                        index = experience_store().comment_index()
+                        found = index.search(recherche, None if modele == "Tous les véhicules" else modele)
+                    
+                    if found.total:
+                        st.markdown(f"**{found.total} trajet(s)** dont le commentaire correspond")
+                        if modele == "Tous les véhicules" and len(found.per_model) > 1:
+                            st.caption(" • ".join(
+                                f"{model} : {count}" for model, count in found.per_model.head(10).items()
+                            ))
+                        for hit in found.hits:
+                            details = " · ".join(filter(None, [hit.model, hit.bilan, hit.month]))
+                            st.markdown(
+                                f"**{html.escape(details)}** — {highlighted(hit.snippet)}",
+                                unsafe_allow_html=True
+                            )
+                        if found.total > len(found.hits):
+                            st.caption(f"{len(found.hits)} trajets les plus récents affichés")
+                    else:
+                        st.info("Aucun commentaire ne correspond à cette recherche")
+                else:
+                    st.info("Saisissez un ou plusieurs mots (sans se soucier des accents ni des majuscules)")
+
+
+def main():
+    run = METRICS.start_run()
+    # Mesures closes même après un retour anticipé (catalogue absent) ou une exception
+    try:
+        render_page()
+    finally:
+        STARTUP.finish()
+        total = METRICS.finish_run(run)
+    
+    # Rapport de démarrage (premier affichage du processus)
+    if STARTUP_REPORT:
+        with st.sidebar.expander("⏱️ Démarrage"):
+            st.caption(f"Premier affichage : {STARTUP.first_render * 1000:.0f} ms")
+            for name, seconds in STARTUP.rows():
+                st.write(f"{name} : {seconds * 1000:.0f} ms")
+    
+    # Panneau de performances (mesures de tout le processus)
+    if DEBUG_PANEL:
+        with st.sidebar.expander("🛠️ Performances"):
+            st.caption(f"Ce rerun : {total * 1000:.0f} ms")
+            for name, seconds in run['stages'].items():
+                st.write(f"{name} : {seconds * 1000:.1f} ms")
+            st.markdown("**Latence par étape (ms)**")
+            st.dataframe(METRICS.percentiles(), hide_index=True)
+            st.markdown("**Caches**")
+            st.dataframe(METRICS.cache_rates(), hide_index=True)
+            st.download_button(
+                "📥 Exporter les mesures (JSON)",
+                data=json.dumps(METRICS.export(), ensure_ascii=False, indent=1),
+                file_name="30veli_mesures.json",
+                mime="application/json"
+            )
 
 if __name__ == "__main__":
     main()
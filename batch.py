@@ -0,0 +1,242 @@
+"""Recommandations sans interface : API Python et traitement par lots
+
+Le moteur (catalogue compilé, scoring, tri, cache des résultats) ne dépend
+pas de Streamlit :
+
+    from batch import Recommender
+    from recommendation import build_criteria
+
+    recommender = Recommender()
+    recommender.rank(build_criteria(pedaler="NON", nb_enfants=2), k=5)
+
+En ligne de commande, un fichier de profils (CSV ou JSONL, une colonne par
+critère : pedaler, nb_enfants, nb_adultes, chargement, couverture,
+territoire, cas_usage, et éventuellement id) est évalué et les classements
+sont écrits au fil de l'eau, en plusieurs processus pour les gros fichiers :
+
+    python batch.py profils.csv [--output classements.jsonl] [--top 10]
+                                [--sort "Autonomie"] [--workers 4]
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+
+from catalogue import ARTIFACT_DIR, CATALOGUE_PATH, load_catalogue, load_compiled_catalogue
+from lattice import CriteriaLattice
+from recommendation import SORT_OPTIONS, SPEC_SORT_OPTIONS, RecommendationCache, build_criteria
+
+PROFILE_FIELDS = ('pedaler', 'nb_enfants', 'nb_adultes', 'chargement', 'couverture', 'territoire', 'cas_usage')
+
+# En dessous, les profils sont évalués dans le processus principal
+PARALLEL_THRESHOLD = 2000
+
+# Profils envoyés à la fois à chaque processus
+CHUNK_SIZE = 256
+
+CSV_COLUMNS = ['id', 'rank', 'vehicle', 'score', 'matches', 'mismatches', 'error']
+
+
+class Recommender:
+    """Moteur de recommandation : catalogue, cache des résultats et treillis optionnel
+
+    Avec store (catalogue.CatalogueStore), le catalogue servi suit les
+    rechargements du classeur ; le treillis est reconstruit pour chaque version.
+    """
+
+    def __init__(self, catalogue=None, lattice=False, store=None):
+        self.store = store
+        if store is None and catalogue is None:
+            catalogue = load_catalogue()
+        self._catalogue = catalogue
+        self.cache = RecommendationCache()
+        self._use_lattice = lattice
+        self._lattice = None
+        self._lattice_lock = threading.Lock()
+        if lattice:
+            self.lattice_for(self.catalogue)
+
+    @property
+    def catalogue(self):
+        """Catalogue servi (celui du store s'il y en a un)"""
+        return self.store.current() if self.store is not None else self._catalogue
+
+    def lattice_for(self, catalogue):
+        """Treillis de ce catalogue (construit au premier appel pour chaque version), ou None"""
+        if not self._use_lattice:
+            return None
+        with self._lattice_lock:
+            if self._lattice is None or self._lattice.version != catalogue.version:
+                self._lattice = CriteriaLattice(catalogue)
+            return self._lattice
+
+    def recommend(self, criteria, experience=None, catalogue=None):
+        """Résultat complet (recommendation.RecommendationResult) pour ces critères
+
+        experience (experiences.ExperienceData) permet le tri par retours
+        d'expérience ; catalogue fixe la version servie (par défaut, la courante).
+        """
+        if catalogue is None:
+            catalogue = self.catalogue
+        data_version = experience.version if experience is not None else None
+        return self.cache.get(
+            catalogue, criteria, data_version, lattice=self.lattice_for(catalogue), experience=experience
+        )
+
+    def rank(self, criteria, tri_par=SORT_OPTIONS[0], k=None):
+        """Véhicules compatibles dans l'ordre demandé (les k premiers si k est donné)"""
+        result = self.recommend(criteria)
+        return result.sorted(tri_par) if k is None else result.top(tri_par, k)
+
+
+def profile_criteria(profile):
+    """Critères d'un profil lu dans un fichier (lève ValueError si une valeur est inconnue)"""
+    fields = {field: profile.get(field) for field in PROFILE_FIELDS}
+    if isinstance(fields['cas_usage'], str):
+        fields['cas_usage'] = [c.strip() for c in fields['cas_usage'].split(';') if c.strip()]
+    return build_criteria(**fields)
+
+
+def read_profiles(path):
+    """Itérer sur les profils d'un fichier CSV ou JSONL (dictionnaires)"""
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith(('.jsonl', '.ndjson', '.json')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def evaluate_profile(recommender, number, profile, tri_par=SORT_OPTIONS[0], k=None):
+    """Classement d'un profil, sous forme sérialisable"""
+    profile_id = profile.get('id') or number
+    try:
+        criteria = profile_criteria(profile)
+    except (TypeError, ValueError) as e:
+        return {'id': profile_id, 'error': str(e)}
+    result = recommender.recommend(criteria)
+    ranked = result.sorted(tri_par) if k is None else result.top(tri_par, k)
+    return {
+        'id': profile_id,
+        'compatible': len(result),
+        'filtered_out': len(result.filtered_out),
+        'recommendations': ranked_records(ranked)
+    }
+
+
+def ranked_records(ranked):
+    """Véhicules classés sous forme sérialisable (rang à partir de 1)"""
+    return [
+        {
+            'rank': rank,
+            'vehicle': reco.name,
+            'score': reco.score,
+            'matches': list(reco.matches),
+            'mismatches': list(reco.mismatches)
+        }
+        for rank, reco in enumerate(ranked, start=1)
+    ]
+
+
+# --- Évaluation en plusieurs processus -------------------------------------
+
+_worker = None
+
+
+def _init_worker(artifact, tri_par, k):
+    """Chaque processus projette l'artefact compilé en mémoire (pages partagées)"""
+    global _worker
+    _worker = (Recommender(load_compiled_catalogue(artifact)), tri_par, k)
+
+
+def _evaluate_in_worker(item):
+    recommender, tri_par, k = _worker
+    return evaluate_profile(recommender, *item, tri_par=tri_par, k=k)
+
+
+def evaluate_profiles(profiles, recommender, artifact=ARTIFACT_DIR, tri_par=SORT_OPTIONS[0], k=None, workers=1):
+    """Classements des profils, dans l'ordre du fichier
+
+    Les profils sont lus au fil de l'eau ; au-delà de PARALLEL_THRESHOLD, ils
+    sont répartis entre workers processus.
+    """
+    items = enumerate(profiles, start=1)
+    head = list(itertools.islice(items, PARALLEL_THRESHOLD))
+    if workers <= 1 or len(head) < PARALLEL_THRESHOLD:
+        for number, profile in itertools.chain(head, items):
+            yield evaluate_profile(recommender, number, profile, tri_par, k)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(artifact, tri_par, k)) as pool:
+        yield from pool.imap(_evaluate_in_worker, itertools.chain(head, items), chunksize=CHUNK_SIZE)
+
+
+# --- Écriture des résultats -----------------------------------------------
+
+def write_jsonl(records, out):
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        yield record
+
+
+def write_csv(records, out):
+    """Une ligne par véhicule recommandé (une ligne vide si aucun, ou l'erreur)"""
+    writer = csv.DictWriter(out, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for record in records:
+        recommendations = record.get('recommendations') or [{}]
+        for reco in recommendations:
+            writer.writerow({
+                'id': record['id'],
+                'rank': reco.get('rank'),
+                'vehicle': reco.get('vehicle'),
+                'score': reco.get('score'),
+                'matches': ' ; '.join(reco.get('matches', [])),
+                'mismatches': ' ; '.join(reco.get('mismatches', [])),
+                'error': record.get('error')
+            })
+        yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classer les véhicules pour un fichier de profils")
+    parser.add_argument('profiles', help="profils de critères (CSV ou JSONL)")
+    parser.add_argument('--output', help="fichier des classements (sortie standard par défaut)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help="format de sortie (déduit de l'extension de --output, JSONL par défaut)")
+    parser.add_argument('--sort', default=SORT_OPTIONS[0], choices=SPEC_SORT_OPTIONS, help="ordre du classement")
+    parser.add_argument('--top', type=int, default=10, help="véhicules par profil (0 : tous)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processus pour les gros fichiers")
+    parser.add_argument('--catalogue', default=CATALOGUE_PATH, help="classeur Excel des caractéristiques")
+    parser.add_argument('--artifact', default=ARTIFACT_DIR, help="répertoire de l'artefact compilé")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('csv' if args.output and args.output.endswith('.csv') else 'jsonl')
+    recommender = Recommender(load_catalogue(args.catalogue, args.artifact))
+    records = evaluate_profiles(
+        read_profiles(args.profiles), recommender, artifact=args.artifact,
+        tri_par=args.sort, k=args.top or None, workers=args.workers
+    )
+
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        write = write_csv if output_format == 'csv' else write_jsonl
+        n_profiles = n_errors = 0
+        for record in write(records, out):
+            n_profiles += 1
+            if 'error' in record:
+                n_errors += 1
+                print(f"⚠️ Profil {record['id']} : {record['error']}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"✅ {n_profiles} profils évalués ({n_errors} en erreur)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
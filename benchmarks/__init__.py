@@ -0,0 +1 @@
+"""Benchmarks hors ligne sur données synthétiques"""
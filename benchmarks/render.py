@@ -0,0 +1,55 @@
+"""Mesure de l'exécution de l'application en mémoire (sans serveur Streamlit)
+
+Lancé par benchmarks.run dans un répertoire contenant le classeur et l'export
+synthétiques ; chaque mesure est écrite sur une ligne JSON.
+"""
+import argparse
+import json
+import time
+
+from streamlit.testing.v1 import AppTest
+
+RUN_TIMEOUT = 600
+
+
+def timed_run(app):
+    start = time.perf_counter()
+    app.run(timeout=RUN_TIMEOUT)
+    duration = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return duration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesurer l'exécution de l'application")
+    parser.add_argument('--app', required=True, help="chemin de app.py")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    app = AppTest.from_file(args.app, default_timeout=RUN_TIMEOUT)
+
+    # Premier passage : compilation du catalogue et lecture de l'export
+    results = [{'benchmark': 'render.cold', 'durations': [timed_run(app)]}]
+
+    # Rerun sans changement : caches chauds, cartes et onglet Statistiques réaffichés
+    results.append({
+        'benchmark': 'render.warm',
+        'durations': [timed_run(app) for _ in range(args.repeat)]
+    })
+
+    # Changement de critère (nombre d'enfants) : scoring puis affichage
+    selectbox = app.sidebar.selectbox[0]
+    options = list(selectbox.options)
+    durations = []
+    for i in range(args.repeat):
+        app.sidebar.selectbox[0].set_value(type(selectbox.value)(options[(i + 1) % len(options)]))
+        durations.append(timed_run(app))
+    results.append({'benchmark': 'render.criteria', 'durations': durations})
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""Benchmarks hors ligne du chargement, du scoring, du tri et des agrégations
+
+Les données sont synthétiques (benchmarks.synthetic) : catalogues de N
+véhicules et exports de M trajets. Chaque mesure est écrite sur une ligne JSON
+(temps minimal, médian et moyen sur plusieurs répétitions) pour suivre les
+régressions ; un résumé lisible est affiché sur la sortie d'erreur.
+
+    python -m benchmarks.run [--vehicles 30,300,3000] [--trips 1000,100000]
+                             [--repeat 5] [--output resultats.jsonl] [--render]
+
+Aucun serveur Streamlit n'est lancé ; --render exécute l'application en
+mémoire (streamlit.testing) pour mesurer l'affichage des cartes et de
+l'onglet Statistiques.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import (synthetic_specs, synthetic_trips, vehicle_names,
+                                  write_specs_xlsx, write_trips_csv)
+from catalogue import (CATALOGUE_PATH, Catalogue, compile_catalogue,
+                       load_compiled_catalogue, read_catalogue)
+from comments import CommentIndex
+from cube import StatisticsCube
+from experiences import (READ_OPTIONS, ExperienceData, build_model_aggregates, compact_trips,
+                         memory_usage, normalize_trips, read_experiences)
+from exports import FORMATS, ExportCache, catalogue_frames, recommendation_frames
+from lattice import AXES, CriteriaLattice
+from recommendation import EXPERIENCE_SORT, SPEC_SORT_OPTIONS, build_criteria, recommend
+from relaxation import CriteriaBitsets, near_misses, relaxations
+from scoring import score_catalogue
+
+# Nombre de véhicules affichés par page (comme app.PAGE_SIZE)
+PAGE_SIZE = 10
+
+# Nombre de profils de critères évalués par mesure de scoring
+N_PROFILES = 64
+
+# Part de trajets ajoutés pour la mesure d'ingestion incrémentale
+APPEND_FRACTION = 0.01
+
+# Au-delà, le treillis (cellules × véhicules) devient trop volumineux pour être mesuré
+LATTICE_MAX_VEHICLES = 5000
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(fn, repeat, setup=None):
+    """Durées (secondes) de repeat appels à fn ; setup prépare l'argument hors chronométrage"""
+    durations = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(arg)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def record(benchmark, durations, ops=1, **params):
+    """Ligne de résultat d'une mesure"""
+    median = statistics.median(durations)
+    return {
+        'benchmark': benchmark,
+        **params,
+        'ops': ops,
+        'repeat': len(durations),
+        'min_s': min(durations),
+        'median_s': median,
+        'mean_s': statistics.fmean(durations),
+        'max_s': max(durations),
+        'per_op_s': median / ops
+    }
+
+
+def environment():
+    return {
+        'benchmark': 'environment',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__
+    }
+
+
+def criteria_profiles(n_profiles=N_PROFILES, seed=0):
+    """Combinaisons de critères tirées au hasard parmi les options de la barre latérale"""
+    rng = np.random.default_rng(seed)
+    return [
+        {name: values[rng.integers(len(values))] for name, values in AXES}
+        for _ in range(n_profiles)
+    ]
+
+
+def bench_catalogue(n_vehicles, workdir, repeat):
+    """Lecture du classeur, compilation et chargement de l'artefact, scoring et tri"""
+    source = os.path.join(workdir, f"catalogue-{n_vehicles}.xlsx")
+    output = os.path.join(workdir, f"catalogue-{n_vehicles}")
+    write_specs_xlsx(synthetic_specs(n_vehicles), source)
+    params = {'vehicles': n_vehicles}
+
+    yield record('catalogue.read_xlsx', measure(lambda _: read_catalogue(source), repeat), **params)
+    yield record('catalogue.compile', measure(lambda _: compile_catalogue(source, output), repeat), **params)
+    yield record('catalogue.load_artifact', measure(lambda _: load_compiled_catalogue(output), repeat), **params)
+
+    catalogue = load_compiled_catalogue(output)
+    specs = catalogue.specs
+    yield record('catalogue.from_specs', measure(lambda _: Catalogue.from_specs(specs), repeat), **params)
+
+    profiles = criteria_profiles()
+    ops = len(profiles)
+    yield record('scoring.score_catalogue', measure(
+        lambda _: [score_catalogue(catalogue.matrices, c) for c in profiles], repeat
+    ), ops=ops, **params)
+    yield record('scoring.recommend', measure(
+        lambda _: [recommend(catalogue, c) for c in profiles], repeat
+    ), ops=ops, **params)
+
+    results = [recommend(catalogue, c) for c in profiles]
+    for tri_par in SPEC_SORT_OPTIONS:
+        yield record('sort.full', measure(
+            lambda _: [r.sorted(tri_par) for r in results], repeat
+        ), ops=ops, tri_par=tri_par, **params)
+        yield record('sort.top', measure(
+            lambda _: [r.top(tri_par, PAGE_SIZE) for r in results], repeat
+        ), ops=ops, tri_par=tri_par, k=PAGE_SIZE, **params)
+
+    # Exports (version None : fichier réécrit à chaque mesure)
+    exports = ExportCache(os.path.join(workdir, f"exports-{n_vehicles}"))
+    result = recommend(catalogue, profiles[0])
+    for fmt in FORMATS:
+        yield record('export.catalogue', measure(
+            lambda _: exports.path('catalogue', None, fmt, lambda: catalogue_frames(catalogue)), repeat
+        ), format=fmt, **params)
+        yield record('export.recommendations', measure(
+            lambda _: exports.path('recommandations', None, fmt,
+                                   lambda: recommendation_frames(result, SPEC_SORT_OPTIONS[0])), repeat
+        ), format=fmt, **params)
+
+    # Tri par retours d'expérience : clés lues dans les agrégats par modèle
+    experience = ExperienceData.from_trips(normalize_trips(synthetic_trips(10 * n_vehicles, vehicle_names(n_vehicles))))
+    yield record('sort.experience', measure(
+        lambda _: [recommend(catalogue, c, experience).top(EXPERIENCE_SORT, PAGE_SIZE) for c in profiles], repeat,
+        setup=lambda: experience.ranking_scores()
+    ), ops=ops, k=PAGE_SIZE, **params)
+
+    # Assouplissements : profils sans véhicule compatible (les plus exigeants)
+    strict = [build_criteria('OUI', 4, 3), build_criteria('NON', 4, 3), build_criteria('NON', 3, 2)]
+    yield record('relaxation.bitsets', measure(lambda _: CriteriaBitsets(catalogue.matrices), repeat), **params)
+    bitsets = CriteriaBitsets(catalogue.matrices)
+    yield record('relaxation.suggest', measure(
+        lambda _: [(relaxations(bitsets, c), near_misses(bitsets, c)) for c in strict], repeat
+    ), ops=len(strict), **params)
+
+    if n_vehicles <= LATTICE_MAX_VEHICLES:
+        yield record('lattice.build', measure(lambda _: CriteriaLattice(catalogue), repeat), **params)
+        lattice = CriteriaLattice(catalogue)
+        yield record('lattice.lookup', measure(
+            lambda _: [lattice.lookup(c, SPEC_SORT_OPTIONS[0]) for c in profiles], repeat
+        ), ops=ops, nbytes=lattice.nbytes, **params)
+        yield record('lattice.result', measure(
+            lambda _: [lattice.result(c) for c in profiles], repeat
+        ), ops=ops, **params)
+        yield record('lattice.page', measure(
+            lambda _: [lattice.view(c).top(SPEC_SORT_OPTIONS[0], PAGE_SIZE) for c in profiles], repeat
+        ), ops=ops, k=PAGE_SIZE, **params)
+
+
+def _build_comment_index(trips):
+    """Nouvel index des commentaires de trips (préparation hors chronométrage)"""
+    index = CommentIndex()
+    index.add(trips, 0)
+    return index
+
+
+def bench_experiences(n_trips, n_models, workdir, repeat):
+    """Lecture de l'export, agrégation par modèle, ajout incrémental et statistiques"""
+    path = os.path.join(workdir, f"experiences-{n_trips}.csv")
+    models = vehicle_names(n_models)
+    write_trips_csv(synthetic_trips(n_trips, models), path)
+    params = {'trips': n_trips, 'models': n_models}
+
+    yield record('experiences.read_csv', measure(
+        lambda _: normalize_trips(pd.read_csv(path, **READ_OPTIONS)), repeat
+    ), **params)
+
+    yield record('experiences.read_chunks', measure(lambda _: read_experiences(path), repeat), **params)
+
+    trips = normalize_trips(pd.read_csv(path, **READ_OPTIONS))
+    yield record('experiences.aggregate', measure(lambda _: build_model_aggregates(trips), repeat), **params)
+
+    data = ExperienceData.from_trips(trips)
+    compact = compact_trips(trips).drop(columns='commentaires')
+    yield record('experiences.from_trips', measure(lambda _: ExperienceData.from_trips(trips), repeat),
+                 nbytes=memory_usage(compact), aggregates_nbytes=data.memory_usage(),
+                 raw_nbytes=memory_usage(pd.read_csv(path)), **params)
+    n_new = max(1, int(n_trips * APPEND_FRACTION))
+    new_trips = normalize_trips(synthetic_trips(n_new, models, seed=1))
+    yield record('experiences.append', measure(
+        lambda _: data.appended(new_trips), repeat
+    ), new_trips=n_new, **params)
+
+    # Calculs de l'onglet Statistiques
+    yield record('experiences.statistics', measure(
+        lambda _: (data.trips_per_model(), data.bilan_distribution(),
+                   data.average_satisfaction(), data.total_distance()),
+        repeat
+    ), **params)
+    yield record('experiences.model_stats', measure(
+        lambda _: [data.model_stats(model) for model in models], repeat
+    ), ops=len(models), **params)
+
+    # Index des commentaires : construction, ajout et recherches (mot exact, préfixe, par modèle)
+    yield record('comments.build', measure(lambda _: CommentIndex().add(trips, 0), repeat), **params)
+    index = _build_comment_index(trips)
+    yield record('comments.append', measure(
+        lambda i: i.add(new_trips, i.rows), repeat, setup=lambda: _build_comment_index(trips)
+    ), new_trips=n_new, **params)
+    queries = ['pluie', 'enfants ', 'trajet rap', 'gênante pluie']
+    yield record('comments.search', measure(
+        lambda _: [index.search(q) for q in queries] + [index.search(queries[0], model) for model in models[:5]],
+        repeat
+    ), ops=len(queries) + 5, docs=len(index), nbytes=index.nbytes, **params)
+
+    # Cube de statistiques : construction, fusion d'ajouts et filtres de l'onglet
+    yield record('cube.build', measure(lambda _: StatisticsCube.from_trips(compact), repeat),
+                 cells=len(data.cube), **params)
+    new_cube = StatisticsCube.from_trips(compact_trips(new_trips))
+    yield record('cube.merge', measure(lambda _: data.cube.merged(new_cube), repeat), **params)
+    months = data.cube.months()
+    yield record('cube.filter', measure(
+        lambda _: [data.cube.filter([model], months[len(months) // 2:]).bilan_distribution()
+                   for model in models],
+        repeat
+    ), ops=len(models), **params)
+
+
+def bench_render(n_vehicles, n_trips, workdir, repeat):
+    """Exécution de l'application en mémoire, dans un processus séparé
+
+    L'application lit ses sources (classeur, export, cache) à l'import : elle
+    est lancée dans un répertoire contenant les données synthétiques.
+    """
+    appdir = os.path.join(workdir, f"app-{n_vehicles}-{n_trips}")
+    os.makedirs(appdir, exist_ok=True)
+    write_specs_xlsx(synthetic_specs(n_vehicles), os.path.join(appdir, CATALOGUE_PATH))
+    experiences_path = os.path.join(appdir, 'experiences.csv')
+    write_trips_csv(synthetic_trips(n_trips, vehicle_names(n_vehicles)), experiences_path)
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get('PYTHONPATH')])),
+        'VELI_EXPERIENCES_SOURCE': experiences_path,
+        'VELI_CACHE_DIR': os.path.join(appdir, '.cache')
+    }
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.render', '--repeat', str(repeat),
+         '--app', os.path.join(ROOT_DIR, 'app.py')],
+        cwd=appdir, env=env, capture_output=True, text=True, check=True
+    )
+    for line in completed.stdout.splitlines():
+        timings = json.loads(line)
+        yield record(timings.pop('benchmark'), timings.pop('durations'),
+                     vehicles=n_vehicles, trips=n_trips, **timings)
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def _summary(result):
+    params = ', '.join(
+        f"{key}={value}" for key, value in result.items()
+        if key in ('vehicles', 'trips', 'tri_par', 'format')
+    )
+    return f"{result['benchmark']:<28} {params:<45} médiane {result['median_s'] * 1000:10.3f} ms"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne sur données synthétiques")
+    parser.add_argument('--vehicles', type=_sizes, default=[30, 300, 3000],
+                        help="tailles de catalogue, séparées par des virgules")
+    parser.add_argument('--trips', type=_sizes, default=[1000, 10000, 100000],
+                        help="tailles de l'export des expériences, séparées par des virgules")
+    parser.add_argument('--models', type=int, default=30, help="nombre de modèles dans les trajets")
+    parser.add_argument('--repeat', type=int, default=5, help="répétitions de chaque mesure")
+    parser.add_argument('--render', action='store_true',
+                        help="mesurer aussi l'exécution de l'application (plus lent)")
+    parser.add_argument('--workdir', help="conserver les données générées dans ce répertoire")
+    parser.add_argument('--output', help="fichier JSON Lines des résultats (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='veli-bench-') as tmpdir:
+        workdir = args.workdir or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            def emit(result):
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                out.flush()
+                if result['benchmark'] != 'environment':
+                    print(_summary(result), file=sys.stderr)
+
+            emit(environment())
+            for n_vehicles in args.vehicles:
+                for result in bench_catalogue(n_vehicles, workdir, args.repeat):
+                    emit(result)
+            for n_trips in args.trips:
+                for result in bench_experiences(n_trips, args.models, workdir, args.repeat):
+                    emit(result)
+            if args.render:
+                for n_vehicles in args.vehicles:
+                    for result in bench_render(n_vehicles, max(args.trips), workdir, args.repeat):
+                        emit(result)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == "__main__":
+    main()
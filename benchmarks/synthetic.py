@@ -0,0 +1,81 @@
+"""Génération de données synthétiques pour les benchmarks
+
+Catalogues au format réel de la feuille 'Caractéristiques Véhicules' et
+exports d'expériences (Model, vehicule, bilan, commentaires, totalDistanceKm).
+"""
+import numpy as np
+import pandas as pd
+
+from schema import (AUTONOMIE_COLUMN, CHARGEMENT_OPTIONS, REMARQUES_COLUMN,
+                    SHEET_NAME, VEHICLE_COLUMN, VITESSE_COLUMN)
+
+BOOLEAN_COLUMNS = (
+    ['Nécessite de pédaler (OUI/NON)']
+    + [f"Passagers enfants - {n}" for n in (1, 2, 3)]
+    + [f"Passagers adultes - {n}" for n in (1, 2, 3)]
+    + [f"Chargement - {option}" for option in CHARGEMENT_OPTIONS]
+    + ['Totalement couvert (OUI/NON)', 'Partiellement couvert (OUI/NON)']
+    + [f"Adapté terrain {terrain} (OUI/NON)" for terrain in ('plat', 'vallonné', 'montagneux')]
+)
+
+BILANS = ['Très positif', 'Positif', 'Neutre', 'Négatif']
+BILAN_WEIGHTS = [0.3, 0.35, 0.2, 0.15]
+
+COMMENTS = [
+    "Très pratique pour les courses du samedi",
+    "La côte avant le travail reste difficile",
+    "Pluie gênante malgré la couverture",
+    "Les enfants adorent, trajet rapide",
+    "Autonomie un peu juste en hiver",
+    "Stationnement facile en centre-ville"
+]
+
+
+def vehicle_names(n_vehicles):
+    return [f"Véhicule {i:05d}" for i in range(n_vehicles)]
+
+
+def synthetic_specs(n_vehicles, seed=0):
+    """Catalogue de n_vehicles véhicules avec les colonnes du tableur réel"""
+    rng = np.random.default_rng(seed)
+    data = {VEHICLE_COLUMN: vehicle_names(n_vehicles)}
+    for col in BOOLEAN_COLUMNS:
+        data[col] = np.where(rng.random(n_vehicles) < 0.5, 'OUI', 'NON')
+    data[VITESSE_COLUMN] = rng.choice([25, 45, 90], n_vehicles)
+    data[AUTONOMIE_COLUMN] = rng.integers(30, 150, n_vehicles)
+    data[REMARQUES_COLUMN] = np.nan
+    return pd.DataFrame(data)
+
+
+def write_specs_xlsx(specs, path):
+    """Écrire un catalogue dans un classeur Excel comme le fichier réel"""
+    with pd.ExcelWriter(path) as writer:
+        specs.to_excel(writer, sheet_name=SHEET_NAME, index=False)
+
+
+def synthetic_trips(n_trips, models, seed=0):
+    """Export d'expériences de n_trips trajets répartis sur les modèles donnés"""
+    rng = np.random.default_rng(seed)
+    models = np.asarray(models, dtype=object)
+    model = models[rng.integers(0, len(models), n_trips)]
+    # Une partie des trajets n'a que 'vehicule' renseigné, quelques-uns aucun des deux
+    missing_model = rng.random(n_trips) < 0.1
+    missing_both = missing_model & (rng.random(n_trips) < 0.2)
+    comments = np.asarray(COMMENTS, dtype=object)[rng.integers(0, len(COMMENTS), n_trips)]
+    comments[rng.random(n_trips) < 0.6] = None
+    bilan = np.asarray(BILANS, dtype=object)[rng.choice(len(BILANS), n_trips, p=BILAN_WEIGHTS)]
+    bilan[rng.random(n_trips) < 0.05] = None
+    start = np.datetime64('2023-01-01T00:00:00')
+    return pd.DataFrame({
+        'id': np.arange(n_trips),
+        'createdAt': start + np.sort(rng.integers(0, 3 * 365 * 86400, n_trips)).astype('timedelta64[s]'),
+        'Model': np.where(missing_model, None, model),
+        'vehicule': np.where(missing_both, None, model),
+        'bilan': bilan,
+        'commentaires': comments,
+        'totalDistanceKm': np.round(rng.gamma(2.0, 4.0, n_trips), 2)
+    })
+
+
+def write_trips_csv(trips, path):
+    trips.to_csv(path, index=False)
@@ -0,0 +1,253 @@
+"""Chargement du catalogue des véhicules
+
+Le tableau Excel, son schéma résolu et les matrices de scoring sont construits
+ensemble et mis en cache comme un seul objet.
+
+Le classeur n'est analysé (openpyxl) qu'à la compilation : le catalogue est
+écrit dans un artefact en colonnes (tableau Arrow IPC et matrices booléennes
+.npy, projetés en mémoire et partagés entre processus ; métadonnées JSON).
+Chaque compilation produit une version immuable, désignée ensuite par
+catalogue.json. L'application charge l'artefact et ne le reconstruit que si
+le classeur a changé (date, taille puis empreinte).
+
+Compilation hors ligne :
+    python catalogue.py compile [--source FICHIER.xlsx] [--output REPERTOIRE]
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from schema import SHEET_NAME, CatalogueSchema
+from refresher import BackgroundTask
+from scoring import CatalogueMatrices
+from settings import CACHE_DIR
+from shared import VersionedDirectory, read_arrow, write_arrow
+
+CATALOGUE_PATH = '30veli_caracteristiques_vehicules.xlsx'
+
+# Répertoire de l'artefact compilé
+ARTIFACT_DIR = os.environ.get('VELI_CATALOGUE_ARTIFACT', os.path.join(CACHE_DIR, 'catalogue'))
+
+ARTIFACT_FORMAT = 2
+
+# Délai (secondes) avant un nouvel essai après une erreur d'entrée-sortie
+# (fichier verrouillé, disque plein, copie en cours)
+RETRY_SECONDS = 30
+
+
+@dataclass
+class Catalogue:
+    """Caractéristiques des véhicules, schéma résolu et matrices de scoring"""
+    specs: pd.DataFrame
+    schema: CatalogueSchema
+    matrices: CatalogueMatrices
+    version: str = None
+
+    @classmethod
+    def from_specs(cls, specs, version=None):
+        """Valider le schéma et précalculer les matrices (lève SchemaError)"""
+        schema = CatalogueSchema.from_columns(specs.columns)
+        return cls(
+            specs=specs,
+            schema=schema,
+            matrices=CatalogueMatrices.from_specs(specs, schema),
+            version=version
+        )
+
+    def __len__(self):
+        return len(self.specs)
+
+
+def file_digest(path):
+    """Empreinte SHA-256 d'un fichier"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_catalogue(path=CATALOGUE_PATH):
+    """Lire la feuille des caractéristiques et construire le catalogue"""
+    specs = pd.read_excel(path, sheet_name=SHEET_NAME)
+    return Catalogue.from_specs(specs, version=file_digest(path))
+
+
+def _columnar_specs(specs):
+    """Rendre les colonnes texte homogènes pour l'écriture en Parquet"""
+    specs = specs.copy()
+    for col in specs.columns:
+        if specs[col].dtype == object:
+            specs[col] = specs[col].where(specs[col].isna(), specs[col].astype(str))
+    return specs
+
+
+def artifact_versions(output=ARTIFACT_DIR):
+    """Versions de l'artefact ; catalogue.json désigne la courante"""
+    return VersionedDirectory(output, pointer='catalogue.json')
+
+
+def compile_catalogue(source=CATALOGUE_PATH, output=ARTIFACT_DIR):
+    """Valider le classeur et écrire l'artefact compilé ; retourne ses métadonnées"""
+    catalogue = read_catalogue(source)
+    matrices = catalogue.matrices
+    stat = os.stat(source)
+
+    def write(directory):
+        write_arrow(_columnar_specs(catalogue.specs), os.path.join(directory, 'specs.arrow'))
+        np.save(os.path.join(directory, 'positive.npy'), matrices.positive)
+        np.save(os.path.join(directory, 'has_value.npy'), matrices.has_value)
+
+    features = sorted(matrices.features.items(), key=lambda item: item[1])
+    meta = {
+        'format': ARTIFACT_FORMAT,
+        'source': os.path.abspath(source),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': catalogue.version,
+        'vehicles': len(catalogue),
+        'features': [list(key) for key, _ in features]
+    }
+    # Nouvelle version dans son propre répertoire : les processus qui ont
+    # projeté la précédente la gardent jusqu'à leur prochain chargement
+    return artifact_versions(output).publish(f"{catalogue.version[:16]}-{ARTIFACT_FORMAT}", write, meta)
+
+
+def read_artifact_meta(output=ARTIFACT_DIR):
+    return artifact_versions(output).read_pointer()
+
+
+def is_artifact_fresh(source=CATALOGUE_PATH, output=ARTIFACT_DIR):
+    """Vérifier que l'artefact correspond au classeur (date et taille, sinon empreinte)"""
+    versions = artifact_versions(output)
+    meta = versions.read_pointer()
+    if meta.get('format') != ARTIFACT_FORMAT or not os.path.isdir(versions.path(meta['version'])):
+        return False
+    stat = os.stat(source)
+    if meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('size') == stat.st_size:
+        return True
+    if meta.get('size') == stat.st_size and meta.get('sha256') == file_digest(source):
+        # Fichier touché sans être modifié : inutile de recompiler
+        versions.write_pointer({**meta, 'mtime_ns': stat.st_mtime_ns})
+        return True
+    return False
+
+
+def load_compiled_catalogue(output=ARTIFACT_DIR):
+    """Charger l'artefact compilé, projeté en mémoire (lecture seule, sans copie)"""
+    versions = artifact_versions(output)
+    meta = versions.read_pointer()
+    version = meta['version']
+    specs = read_arrow(versions.path(version, 'specs.arrow'))
+    schema = CatalogueSchema.from_columns(specs.columns)
+    matrices = CatalogueMatrices(
+        names=specs[schema.vehicle].tolist(),
+        features={tuple(key): j for j, key in enumerate(meta['features'])},
+        positive=np.load(versions.path(version, 'positive.npy'), mmap_mode='r'),
+        has_value=np.load(versions.path(version, 'has_value.npy'), mmap_mode='r')
+    )
+    return Catalogue(specs=specs, schema=schema, matrices=matrices, version=meta['sha256'])
+
+
+def load_catalogue(source=CATALOGUE_PATH, output=ARTIFACT_DIR):
+    """Charger le catalogue depuis l'artefact, recompilé si le classeur a changé"""
+    if not is_artifact_fresh(source, output):
+        compile_catalogue(source, output)
+    return load_compiled_catalogue(output)
+
+
+class CatalogueStore:
+    """Catalogue servi aux requêtes, rechargé en arrière-plan quand le classeur change
+
+    Seul le premier chargement est bloquant ; ensuite, le catalogue précédent
+    reste servi jusqu'à ce que le nouveau soit compilé et chargé.
+    """
+
+    def __init__(self, source=CATALOGUE_PATH, output=ARTIFACT_DIR):
+        self.source = source
+        self.output = output
+        self._lock = threading.Lock()
+        self._catalogue = None
+        self._file_version = None
+        # Dernière version du classeur en échec, son erreur et l'heure du prochain essai
+        # (None : erreur du classeur lui-même, retentée seulement s'il change)
+        self._failed_version = None
+        self._error = None
+        self._retry_at = None
+        self._reload_task = BackgroundTask('reload-catalogue', self.reload)
+
+    def file_version(self):
+        """Date et taille du classeur (None s'il est absent)"""
+        try:
+            stat = os.stat(self.source)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def current(self):
+        """Catalogue servi ; un classeur modifié est rechargé en arrière-plan"""
+        catalogue = self._catalogue
+        if catalogue is None:
+            return self.reload()
+        file_version = self.file_version()
+        if file_version != self._file_version and not self._failed(file_version):
+            self._reload_task.start()
+        return catalogue
+
+    def _failed(self, file_version):
+        """Vrai si cette version du classeur a échoué et ne doit pas encore être retentée"""
+        if self._error is None or file_version != self._failed_version:
+            return False
+        return self._retry_at is None or time.monotonic() < self._retry_at
+
+    def reload(self):
+        """Recharger le catalogue si le classeur a changé (bloquant) et le servir
+
+        Une version du classeur invalide (schéma, format) n'est essayée qu'une
+        fois : tant qu'elle ne change pas, le catalogue précédent reste servi
+        (ou l'erreur est relevée de nouveau s'il n'y en a pas). Après une erreur
+        d'entrée-sortie, un nouvel essai a lieu au bout de RETRY_SECONDS.
+        """
+        with self._lock:
+            file_version = self.file_version()
+            if self._catalogue is not None and file_version == self._file_version:
+                return self._catalogue
+            if self._failed(file_version):
+                if self._catalogue is not None:
+                    return self._catalogue
+                raise self._error.with_traceback(None)
+            try:
+                catalogue = load_catalogue(self.source, self.output)
+            except Exception as e:
+                self._failed_version = file_version
+                self._error = e
+                self._retry_at = time.monotonic() + RETRY_SECONDS if isinstance(e, OSError) else None
+                raise
+            self._file_version = file_version
+            self._catalogue = catalogue
+            self._failed_version = None
+            self._error = None
+            self._retry_at = None
+            return catalogue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compiler le catalogue des véhicules")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help="valider le classeur et écrire l'artefact")
+    compile_parser.add_argument('--source', default=CATALOGUE_PATH, help="classeur Excel des caractéristiques")
+    compile_parser.add_argument('--output', default=ARTIFACT_DIR, help="répertoire de l'artefact")
+    args = parser.parse_args(argv)
+
+    meta = compile_catalogue(args.source, args.output)
+    print(f"✅ Catalogue compilé : {meta['vehicles']} véhicules, {len(meta['features'])} caractéristiques -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Index inversé des commentaires des trajets
+
+Chaque commentaire est découpé en mots sans accents ni majuscules
+(« Pluie gênante » → pluie, genante) ; l'index associe à chaque mot la liste
+des trajets qui le contiennent. Une recherche intersecte ces listes au lieu
+de parcourir tous les commentaires ; le dernier mot de la requête est traité
+comme un préfixe pour la saisie au fil de l'eau.
+
+L'index suit l'instantané des expériences : seules les lignes ajoutées sont
+indexées, et une nouvelle génération (export réécrit) le reconstruit.
+Les textes identiques (fréquents) ne sont stockés et découpés qu'une fois.
+"""
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Colonnes de l'instantané lues pour l'index
+INDEX_COLUMNS = ['Model', 'bilan', 'month', 'commentaires']
+
+# Trajets renvoyés au plus par une recherche
+SEARCH_LIMIT = 50
+
+# Longueur d'un extrait (caractères) et contexte gardé avant le premier mot trouvé
+SNIPPET_LENGTH = 160
+SNIPPET_CONTEXT = 40
+
+# Mots trop fréquents pour être discriminants (ignorés à l'indexation et dans les requêtes)
+STOP_WORDS = frozenset("""
+a au aux avec c ce ces d dans de des du elle en est et il j je l la le les leur
+m ma mais me mes n ne on ou par pas pour qu que qui s sa se ses son sur t ta te
+tres un une y
+""".split())
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+# Ligatures qui ne se décomposent pas en Unicode
+_LIGATURES = {'œ': 'oe', 'æ': 'ae', 'ß': 'ss'}
+
+
+def fold(text):
+    """Texte en minuscules sans accents, et position d'origine de chaque caractère"""
+    folded = []
+    positions = []
+    for i, char in enumerate(text.lower()):
+        char = _LIGATURES.get(char, char)
+        for part in unicodedata.normalize('NFKD', char):
+            if not unicodedata.combining(part):
+                folded.append(part)
+                positions.append(i)
+    return ''.join(folded), positions
+
+
+def tokenize(text):
+    """Mots indexés d'un texte (sans accents, sans mots vides)"""
+    return [word for word in _WORD.findall(fold(text)[0]) if word not in STOP_WORDS]
+
+
+def snippet(text, terms, prefix=None):
+    """Extrait du texte autour des mots trouvés : liste de (fragment, surligné)"""
+    folded, positions = fold(text)
+    spans = []
+    for match in _WORD.finditer(folded):
+        word = match.group()
+        if word in terms or (prefix and word.startswith(prefix)):
+            spans.append((positions[match.start()], positions[match.end() - 1] + 1))
+
+    start = max(0, spans[0][0] - SNIPPET_CONTEXT) if spans else 0
+    end = min(len(text), start + SNIPPET_LENGTH)
+    parts = [("…", False)] if start > 0 else []
+    cursor = start
+    for span_start, span_end in spans:
+        if span_start < cursor or span_start >= end:
+            continue
+        if span_start > cursor:
+            parts.append((text[cursor:span_start], False))
+        parts.append((text[span_start:span_end], True))
+        cursor = span_end
+    if cursor < end:
+        parts.append((text[cursor:end], False))
+    if end < len(text):
+        parts.append(("…", False))
+    return parts
+
+
+class _Interned:
+    """Valeurs distinctes numérotées dans l'ordre d'apparition"""
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def id(self, value):
+        key = self.ids.get(value)
+        if key is None:
+            key = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return key
+
+
+@dataclass(frozen=True)
+class CommentHit:
+    """Trajet dont le commentaire correspond à la recherche (row : ligne de l'instantané)"""
+    row: int
+    model: str
+    bilan: str
+    month: str
+    text: str
+    snippet: list
+
+
+@dataclass(frozen=True)
+class CommentSearch:
+    """Résultat d'une recherche : nombre de trajets (total et par modèle) et premiers trajets"""
+    total: int
+    per_model: pd.Series
+    hits: list
+
+
+class CommentIndex:
+    """Index inversé des commentaires d'une génération de l'instantané"""
+
+    def __init__(self, generation=None):
+        self.generation = generation
+        # Lignes de l'instantané déjà indexées
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._vocabulary = []
+        self._models = _Interned()
+        self._labels = _Interned()
+        self._texts = _Interned()
+        self._text_tokens = []
+        # Trajets indexés (documents) : ligne, modèle, bilan, mois et texte
+        self._doc_rows = array('Q')
+        self._doc_models = array('I')
+        self._doc_bilans = array('I')
+        self._doc_months = array('I')
+        self._doc_texts = array('I')
+
+    def __len__(self):
+        return len(self._doc_rows)
+
+    def add(self, trips, start_row):
+        """Indexer des trajets (lignes start_row et suivantes de l'instantané)"""
+        with self._lock:
+            self._add(trips, start_row)
+
+    def update(self, chunks):
+        """Indexer les blocs de lignes qui suivent les lignes déjà indexées"""
+        with self._lock:
+            for chunk in chunks:
+                self._add(chunk, self.rows)
+
+    def _add(self, trips, start_row):
+        texts = trips['commentaires']
+        mask = texts.notna().to_numpy()
+        if mask.any():
+            first_doc = len(self._doc_rows)
+            rows = np.arange(start_row, start_row + len(trips), dtype=np.uint64)[mask]
+            self._doc_rows.frombytes(rows.tobytes())
+            for target, name, interned in (
+                (self._doc_models, 'Model', self._models),
+                (self._doc_bilans, 'bilan', self._labels),
+                (self._doc_months, 'month', self._labels),
+                (self._doc_texts, 'commentaires', self._texts)
+            ):
+                values = trips[name][mask] if name in trips.columns else pd.Series([None] * len(rows))
+                codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=False)
+                ids = np.array([interned.id(None if pd.isna(value) else str(value)) for value in uniques],
+                               dtype=np.uint32)
+                target.frombytes(ids[codes].tobytes())
+
+            # Découpage une fois par texte distinct
+            for text_id in range(len(self._text_tokens), len(self._texts.values)):
+                self._text_tokens.append(sorted(set(tokenize(self._texts.values[text_id]))))
+
+            # Documents ajoutés, regroupés par texte puis par mot ; ils suivent
+            # tous les documents existants : les listes restent triées
+            text_ids = np.array(self._doc_texts[first_doc:], dtype=np.uint32)
+            order = np.argsort(text_ids, kind='stable')
+            unique, starts = np.unique(text_ids[order], return_index=True)
+            new_docs = {}
+            for text_id, docs in zip(unique, np.split(order + first_doc, starts[1:])):
+                for word in self._text_tokens[text_id]:
+                    new_docs.setdefault(word, []).append(docs)
+            for word, blocks in new_docs.items():
+                docs = np.sort(np.concatenate(blocks)).astype(np.uint32)
+                if word not in self._postings:
+                    self._postings[word] = array('I')
+                self._postings[word].frombytes(docs.tobytes())
+            if len(self._vocabulary) != len(self._postings):
+                self._vocabulary = sorted(self._postings)
+        self.rows = start_row + len(trips)
+
+    def _documents(self, word, prefix=False):
+        """Documents contenant un mot (ou un mot commençant par ce préfixe), triés"""
+        if not prefix:
+            postings = self._postings.get(word)
+            return np.frombuffer(postings, dtype=np.uint32) if postings else np.empty(0, np.uint32)
+        i = bisect_left(self._vocabulary, word)
+        matches = []
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(word):
+            matches.append(np.frombuffer(self._postings[self._vocabulary[i]], dtype=np.uint32))
+            i += 1
+        if not matches:
+            return np.empty(0, np.uint32)
+        return matches[0] if len(matches) == 1 else np.unique(np.concatenate(matches))
+
+    def search(self, query, model=None, limit=SEARCH_LIMIT):
+        """Trajets dont le commentaire contient tous les mots de la requête, les plus récents d'abord
+
+        Le dernier mot est un préfixe sauf si la requête se termine par une
+        espace. model limite la recherche à un modèle.
+        """
+        words = _WORD.findall(fold(query)[0])
+        prefix = words.pop() if words and not query[-1:].isspace() else None
+        terms = [word for word in words if word not in STOP_WORDS]
+        if not terms and not prefix:
+            return CommentSearch(total=0, per_model=pd.Series(dtype='int64'), hits=[])
+
+        with self._lock:
+            candidates = [self._documents(word) for word in terms]
+            if prefix:
+                candidates.append(self._documents(prefix, prefix=True))
+            candidates.sort(key=len)
+            docs = candidates[0]
+            for other in candidates[1:]:
+                if not len(docs):
+                    break
+                docs = np.intersect1d(docs, other, assume_unique=True)
+            doc_models = np.frombuffer(self._doc_models, dtype=np.uint32)[docs]
+            if model is not None:
+                model_id = self._models.ids.get(model)
+                keep = doc_models == model_id if model_id is not None else np.zeros(len(docs), bool)
+                docs, doc_models = docs[keep], doc_models[keep]
+
+            counts = np.bincount(doc_models, minlength=len(self._models.values))
+            per_model = pd.Series(counts, index=pd.Index(self._models.values, dtype=object), dtype='int64')
+            per_model = per_model[per_model > 0].sort_values(ascending=False, kind='stable')
+
+            hits = []
+            for doc in docs[::-1][:limit]:
+                text = self._texts.values[self._doc_texts[doc]]
+                hits.append(CommentHit(
+                    row=int(self._doc_rows[doc]),
+                    model=self._models.values[self._doc_models[doc]],
+                    bilan=self._labels.values[self._doc_bilans[doc]],
+                    month=self._labels.values[self._doc_months[doc]],
+                    text=text,
+                    snippet=snippet(text, set(terms), prefix)
+                ))
+        return CommentSearch(total=len(docs), per_model=per_model, hits=hits)
+
+    @property
+    def nbytes(self):
+        """Mémoire approximative de l'index (listes de documents et textes distincts)"""
+        arrays = [*self._postings.values(), self._doc_rows, self._doc_models,
+                  self._doc_bilans, self._doc_months, self._doc_texts]
+        return sum(a.itemsize * len(a) for a in arrays) + sum(len(t) for t in self._texts.values)
@@ -0,0 +1,105 @@
+"""Cube de statistiques des trajets
+
+Les trajets sont comptés par mois × modèle × bilan, avec la distance cumulée.
+Le cube est calculé avec les agrégats par modèle puis fusionné par addition
+quand des trajets s'ajoutent : les filtres et graphiques de l'onglet
+Statistiques portent sur quelques centaines de cellules au lieu des trajets.
+
+Le mois vient de la date de création du trajet (createdAt) quand l'export la
+fournit ; sinon, il reste vide et seules les dimensions modèle et bilan sont
+exploitables.
+"""
+from dataclasses import dataclass
+
+import pandas as pd
+
+DIMENSIONS = ['month', 'Model', 'bilan']
+
+
+def trip_months(created_at):
+    """Mois ('AAAA-MM') de chaque trajet, catégoriel (vide si la date est illisible)"""
+    dates = pd.to_datetime(created_at, errors='coerce', utc=True, format='ISO8601')
+    return dates.dt.strftime('%Y-%m').astype('category')
+
+
+def _cells(cells):
+    """Cellules aux types attendus : dimensions en texte, trips entier, distance flottante"""
+    cells = cells.reset_index(drop=True)
+    for dimension in DIMENSIONS:
+        cells[dimension] = cells[dimension].astype(object)
+    cells['trips'] = cells['trips'].astype('int64')
+    cells['distance'] = cells['distance'].astype('float64')
+    return cells[DIMENSIONS + ['trips', 'distance']]
+
+
+@dataclass(frozen=True)
+class StatisticsCube:
+    """Nombre de trajets et distance par (mois, modèle, bilan)"""
+    cells: pd.DataFrame
+
+    @classmethod
+    def from_trips(cls, trips):
+        """Cube de trajets compacts (experiences.compact_trips)"""
+        month = trips['month'] if 'month' in trips.columns else pd.Series(
+            pd.Categorical([None] * len(trips)), index=trips.index
+        )
+        frame = pd.DataFrame({
+            'month': month,
+            'Model': trips['Model'],
+            'bilan': trips['bilan'],
+            'distance': trips['totalDistanceKm'].astype('float64')
+        })
+        cells = frame.groupby(DIMENSIONS, observed=True, dropna=False).agg(
+            trips=('distance', 'size'),
+            distance=('distance', 'sum')
+        )
+        return cls(_cells(cells.reset_index()))
+
+    @classmethod
+    def from_cells(cls, cells):
+        return cls(_cells(cells))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def merged(self, other):
+        """Cube fusionné avec celui de nouveaux trajets (addition cellule à cellule)"""
+        cells = pd.concat([self.cells, other.cells], ignore_index=True)
+        cells = cells.groupby(DIMENSIONS, dropna=False, sort=False)[['trips', 'distance']].sum()
+        return StatisticsCube.from_cells(cells.reset_index())
+
+    def filter(self, models=None, months=None):
+        """Sous-cube limité à certains modèles et/ou mois (None : pas de filtre)"""
+        mask = pd.Series(True, index=self.cells.index)
+        if models is not None:
+            mask &= self.cells['Model'].isin(list(models))
+        if months is not None:
+            mask &= self.cells['month'].isin(list(months))
+        return StatisticsCube(self.cells[mask].reset_index(drop=True))
+
+    def models(self):
+        return sorted(self.cells['Model'].dropna().unique())
+
+    def months(self):
+        """Mois présents, dans l'ordre chronologique (vide sans dates)"""
+        return sorted(self.cells['month'].dropna().unique())
+
+    def total_trips(self):
+        return int(self.cells['trips'].sum())
+
+    def total_distance(self):
+        return float(self.cells['distance'].sum())
+
+    def trips_per_model(self):
+        """Nombre de trajets par modèle, du plus au moins fréquent"""
+        counts = self.cells.groupby('Model')['trips'].sum()
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def bilan_distribution(self):
+        """Effectifs de chaque bilan (trajets sans bilan exclus)"""
+        counts = self.cells.groupby('bilan')['trips'].sum()
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def trips_per_month(self):
+        """Nombre de trajets par mois, dans l'ordre chronologique (trajets non datés exclus)"""
+        return self.cells.groupby('month')['trips'].sum().sort_index()
@@ -0,0 +1,474 @@
+"""Chargement et agrégation des retours d'expérience
+
+Les trajets sont agrégés une seule fois par modèle (nombre de trajets,
+satisfaction, répartition des bilans, distance, derniers commentaires) et
+par mois × modèle × bilan (cube.StatisticsCube) pour que les cartes véhicules
+et l'onglet Statistiques n'aient plus à refiltrer le CSV complet à chaque
+rerun.
+
+Seules les colonnes utiles de l'export sont lues, par blocs : chaque bloc est
+normalisé, compacté (modèle et bilan catégoriels, distances en float32) puis
+replié dans les agrégats. Les trajets eux-mêmes ne sont pas gardés en
+mémoire ; ils restent dans l'instantané (commentaires compris, relus à la
+demande).
+
+Les agrégats de chaque version de l'instantané sont publiés en Arrow IPC
+(shared.VersionedDirectory) : les autres processus s'y attachent par
+projection en mémoire au lieu de les recalculer et d'en garder une copie.
+
+Empreinte mémoire avant / après :
+    python experiences.py memory [--source FICHIER.csv]
+"""
+import argparse
+import dataclasses
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from comments import INDEX_COLUMNS, CommentIndex
+from cube import StatisticsCube, trip_months
+from refresher import BackgroundTask
+from settings import CACHE_DIR
+from shared import VersionedDirectory, list_column, read_arrow, write_arrow
+from snapshot import CHUNK_ROWS, CsvSnapshot
+
+logger = logging.getLogger(__name__)
+
+EXPERIENCES_URL = 'https://30veli.fabmob.io/cache/30veli_export_experiences.csv'
+
+# Source des expériences (URL ou fichier local pour les tests hors ligne)
+EXPERIENCES_SOURCE = os.environ.get('VELI_EXPERIENCES_SOURCE', EXPERIENCES_URL)
+
+# Poids de chaque bilan dans le taux de satisfaction
+SATISFACTION_WEIGHTS = {
+    'Très positif': 1.0,
+    'Positif': 0.7
+}
+
+N_COMMENTS = 3
+
+# Trajets « a priori » du score d'expérience : la satisfaction et la distance
+# d'un modèle peu essayé sont rapprochées de la moyenne de tous les modèles
+PRIOR_TRIPS = 20
+
+# Part de la distance moyenne par trajet dans le score d'expérience
+DISTANCE_WEIGHT = 0.2
+
+# Colonnes de l'export lues par l'application
+TRIP_COLUMNS = ['createdAt', 'Model', 'vehicule', 'bilan', 'commentaires', 'totalDistanceKm']
+
+# Options de lecture du CSV : colonnes utiles, texte lu comme texte
+READ_OPTIONS = {
+    'usecols': lambda col: col in TRIP_COLUMNS,
+    'dtype': {'createdAt': str, 'Model': str, 'vehicule': str, 'bilan': str, 'commentaires': str}
+}
+
+# Format des données publiées pour les autres processus (voir ExperienceData.write)
+SHARED_FORMAT = 2
+
+
+def compact_trips(df):
+    """Types compacts : modèle, bilan et mois catégoriels, distances en float32
+
+    La date de création n'est gardée que sous forme de mois (month).
+    """
+    compact = pd.DataFrame({
+        'Model': df['Model'].astype('category'),
+        'bilan': df['bilan'].astype('category'),
+        'totalDistanceKm': pd.to_numeric(df['totalDistanceKm'], errors='coerce').astype('float32')
+    })
+    if 'month' in df.columns:
+        compact['month'] = df['month'].astype('category')
+    elif 'createdAt' in df.columns:
+        compact['month'] = trip_months(df['createdAt'])
+    if 'commentaires' in df.columns:
+        compact['commentaires'] = df['commentaires']
+    return compact
+
+
+def normalize_trips(df):
+    """Compléter le modèle depuis 'vehicule', écarter les trajets sans modèle et compacter"""
+    df['Model'] = df['Model'].fillna(df['vehicule'])
+    return compact_trips(df[df['Model'].notna()])
+
+
+def memory_usage(df):
+    """Mémoire occupée par un DataFrame (octets, contenu des chaînes compris)"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def satisfaction_rate(bilan_counts, total):
+    """Taux de satisfaction (en %) à partir des effectifs de chaque bilan
+
+    Fonctionne aussi bien pour un seul modèle (Series indexée par bilan) que
+    pour une table modèle × bilan (total est alors une Series par modèle).
+    """
+    weighted = sum(bilan_counts.get(bilan, 0) * weight for bilan, weight in SATISFACTION_WEIGHTS.items())
+    if isinstance(total, pd.Series):
+        return (weighted / total.where(total > 0) * 100).fillna(0)
+    return weighted / total * 100 if total else 0
+
+
+def experience_scores(by_model, prior_trips=PRIOR_TRIPS):
+    """Score d'expérience (0-100) de chaque modèle, et celui d'un modèle sans trajet
+
+    Satisfaction et distance moyenne par trajet sont lissées vers la moyenne
+    générale avec prior_trips trajets fictifs (confiance selon le nombre de
+    trajets) ; la distance compte pour DISTANCE_WEIGHT, en échelle
+    logarithmique relative au modèle le plus roulant. Seuls les agrégats par
+    modèle sont lus.
+    """
+    trips = by_model['trips'].astype('float64')
+    satisfied = by_model['satisfaction'] * trips / 100
+    total_trips = trips.sum()
+    prior_satisfaction = satisfied.sum() / total_trips * 100 if total_trips else 0.0
+    prior_distance = by_model['total_distance'].sum() / total_trips if total_trips else 0.0
+
+    satisfaction = (satisfied * 100 + prior_trips * prior_satisfaction) / (trips + prior_trips)
+    distance = np.log1p((by_model['total_distance'] + prior_trips * prior_distance) / (trips + prior_trips))
+    scale = distance.max() if len(distance) and distance.max() > 0 else 1.0
+    scores = (1 - DISTANCE_WEIGHT) * satisfaction + DISTANCE_WEIGHT * 100 * distance / scale
+    default = (1 - DISTANCE_WEIGHT) * prior_satisfaction + DISTANCE_WEIGHT * 100 * np.log1p(prior_distance) / scale
+    return {model: float(score) for model, score in scores.items()}, float(default)
+
+
+def build_model_aggregates(trips):
+    """Agréger les trajets par modèle
+
+    Retourne (by_model, bilan_counts) : by_model contient trips, bilan_total,
+    satisfaction, total_distance et comments (liste des premiers commentaires
+    non vides) ; bilan_counts est la table modèle × bilan des effectifs.
+    """
+    # Modèle et bilan catégoriels : seules les catégories présentes sont
+    # regroupées ; index et colonnes des agrégats en texte
+    grouped = trips.groupby('Model', observed=True)
+    by_model = pd.DataFrame({'trips': grouped.size()})
+    by_model.index = by_model.index.astype(object)
+    bilan_counts = trips.groupby(['Model', 'bilan'], observed=True).size().unstack(fill_value=0)
+    bilan_counts.index = bilan_counts.index.astype(object)
+    bilan_counts.columns = bilan_counts.columns.astype(object)
+    bilan_counts = bilan_counts.reindex(by_model.index, fill_value=0)
+    by_model['bilan_total'] = bilan_counts.sum(axis=1)
+    by_model['satisfaction'] = satisfaction_rate(bilan_counts, by_model['trips'])
+    distances = trips['totalDistanceKm'].astype('float64').groupby(trips['Model'], observed=True).sum()
+    by_model['total_distance'] = distances.to_numpy()
+
+    with_comment = trips.loc[trips['commentaires'].notna(), ['Model', 'commentaires']]
+    with_comment = with_comment.assign(Model=with_comment['Model'].astype(object))
+    comments = with_comment.groupby('Model').head(N_COMMENTS).groupby('Model')['commentaires'].agg(list)
+    by_model['comments'] = [
+        comments[model] if model in comments.index else []
+        for model in by_model.index
+    ]
+
+    return by_model, bilan_counts
+
+
+def merge_model_aggregates(by_model, bilan_counts, new_by_model, new_bilan_counts):
+    """Fusionner les agrégats de nouveaux trajets dans des agrégats existants
+
+    Le coût dépend du nombre de modèles et de bilans, pas du nombre de trajets.
+    """
+    merged_bilan = bilan_counts.add(new_bilan_counts, fill_value=0).fillna(0).astype(int)
+    merged = pd.DataFrame(index=merged_bilan.index)
+    merged['trips'] = by_model['trips'].add(new_by_model['trips'], fill_value=0).astype(int)
+    merged['bilan_total'] = merged_bilan.sum(axis=1)
+    merged['satisfaction'] = satisfaction_rate(merged_bilan, merged['trips'])
+    merged['total_distance'] = by_model['total_distance'].add(new_by_model['total_distance'], fill_value=0)
+
+    old_comments = by_model['comments']
+    new_comments = new_by_model['comments']
+    merged['comments'] = [
+        (list(old_comments.get(model, [])) + list(new_comments.get(model, [])))[:N_COMMENTS]
+        for model in merged.index
+    ]
+    return merged, merged_bilan
+
+
+@dataclass
+class ExperienceData:
+    """Agrégats précalculés des trajets recensés (par modèle, modèle × bilan, cube)
+
+    version identifie les données servies par ExperienceStore (None sinon) :
+    elle sert de clé aux calculs mémorisés sur ces données.
+    """
+    by_model: pd.DataFrame
+    bilan_counts: pd.DataFrame
+    cube: StatisticsCube
+    version: tuple = None
+    _scores: tuple = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_trips(cls, trips):
+        by_model, bilan_counts = build_model_aggregates(trips)
+        return cls(by_model=by_model, bilan_counts=bilan_counts,
+                   cube=StatisticsCube.from_trips(compact_trips(trips)))
+
+    @classmethod
+    def from_chunks(cls, chunks, base=None):
+        """Replier des blocs de trajets normalisés dans les agrégats (ceux de base s'il est donné)
+
+        Un seul bloc est en mémoire à la fois.
+        """
+        data = base
+        for chunk in chunks:
+            data = cls.from_trips(chunk) if data is None else data.appended(chunk)
+        if data is None:
+            data = cls.from_trips(normalize_trips(pd.DataFrame({col: pd.Series(dtype=str) for col in TRIP_COLUMNS})))
+        return data
+
+    def __len__(self):
+        return int(self.by_model['trips'].sum())
+
+    def appended(self, new_trips):
+        """Nouvelle version intégrant des trajets ajoutés, sans recalcul complet"""
+        if new_trips is None or len(new_trips) == 0:
+            return self
+        by_model, bilan_counts = merge_model_aggregates(
+            self.by_model, self.bilan_counts, *build_model_aggregates(new_trips)
+        )
+        cube = self.cube.merged(StatisticsCube.from_trips(compact_trips(new_trips)))
+        return ExperienceData(by_model=by_model, bilan_counts=bilan_counts, cube=cube)
+
+    def model_stats(self, model):
+        """Agrégats d'un modèle (None s'il n'a aucun trajet)"""
+        if model not in self.by_model.index:
+            return None
+        return self.by_model.loc[model]
+
+    def ranking_scores(self):
+        """(score d'expérience par modèle, score par défaut), calculés une fois (voir experience_scores)"""
+        if self._scores is None:
+            self._scores = experience_scores(self.by_model)
+        return self._scores
+
+    def trips_per_model(self):
+        """Nombre de trajets par modèle, du plus au moins fréquent"""
+        return self.by_model['trips'].sort_values(ascending=False, kind='stable')
+
+    def bilan_distribution(self):
+        """Effectifs de chaque bilan sur l'ensemble des trajets"""
+        return self.bilan_counts.sum(axis=0).sort_values(ascending=False, kind='stable')
+
+    def average_satisfaction(self):
+        """Satisfaction moyenne (en %) sur les trajets ayant un bilan"""
+        distribution = self.bilan_distribution()
+        return satisfaction_rate(distribution, distribution.sum())
+
+    def total_distance(self):
+        return self.by_model['total_distance'].sum()
+
+    def write(self, directory):
+        """Écrire les agrégats en Arrow IPC (voir attach)"""
+        write_arrow(self.by_model.reset_index(), os.path.join(directory, 'by_model.arrow'))
+        write_arrow(self.bilan_counts.reset_index(), os.path.join(directory, 'bilan_counts.arrow'))
+        write_arrow(self.cube.cells, os.path.join(directory, 'cube.arrow'))
+
+    @classmethod
+    def attach(cls, directory):
+        """Données écrites par write, projetées en mémoire (lecture seule)"""
+        # Agrégats (quelques lignes par modèle) : mêmes types que build_model_aggregates
+        by_model = read_arrow(os.path.join(directory, 'by_model.arrow')).set_index('Model')
+        by_model.index = by_model.index.astype(object)
+        by_model['comments'] = list_column(by_model['comments'])
+        bilan_counts = read_arrow(os.path.join(directory, 'bilan_counts.arrow')).set_index('Model')
+        bilan_counts.index = bilan_counts.index.astype(object)
+        bilan_counts.columns = pd.Index(bilan_counts.columns, dtype=object, name='bilan')
+        return cls(
+            by_model=by_model,
+            bilan_counts=bilan_counts,
+            cube=StatisticsCube.from_cells(read_arrow(os.path.join(directory, 'cube.arrow')))
+        )
+
+    def memory_usage(self):
+        """Mémoire occupée (octets) par les agrégats"""
+        return memory_usage(self.by_model) + memory_usage(self.bilan_counts) + memory_usage(self.cube.cells)
+
+
+def read_experiences(source=EXPERIENCES_URL, chunksize=CHUNK_ROWS):
+    """Lire l'export CSV des expériences par blocs et le replier dans les agrégats"""
+    with pd.read_csv(source, chunksize=chunksize, **READ_OPTIONS) as reader:
+        return ExperienceData.from_chunks(normalize_trips(chunk) for chunk in reader)
+
+
+def experiences_snapshot(source=None, directory=None):
+    """Instantané local de l'export des expériences"""
+    return CsvSnapshot(
+        source or EXPERIENCES_SOURCE,
+        directory or CACHE_DIR,
+        'experiences',
+        prepare=normalize_trips,
+        read_options=READ_OPTIONS
+    )
+
+
+def load_experiences(snapshot=None, revalidate=True):
+    """Servir la dernière copie locale et la revalider en arrière-plan
+
+    Sans instantané (premier démarrage), l'export est téléchargé de façon
+    bloquante.
+    """
+    snapshot = snapshot or experiences_snapshot()
+    if not snapshot.exists():
+        snapshot.refresh()
+    elif revalidate:
+        snapshot.refresh_in_background()
+    return ExperienceData.from_chunks(snapshot.iter_since(0))
+
+
+class ExperienceStore:
+    """Expériences gardées en mémoire et tenues à jour depuis l'instantané
+
+    Quand l'instantané s'allonge (même génération), seules les lignes
+    nouvelles sont lues et fusionnées dans les agrégats ; une nouvelle
+    génération (export réécrit) provoque un rechargement complet.
+
+    Chaque version calculée est publiée dans shared ; si un autre processus
+    l'a déjà publiée, elle est simplement projetée en mémoire.
+
+    Seul le premier chargement est bloquant : ensuite, les nouvelles versions
+    sont calculées en arrière-plan et remplacent d'un bloc celle qui est servie.
+    """
+
+    def __init__(self, snapshot=None, shared=None):
+        self.snapshot = snapshot or experiences_snapshot()
+        self.shared = shared or VersionedDirectory(
+            os.path.join(self.snapshot.directory, f"{self.snapshot.name}-shared")
+        )
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._generation = None
+        self._rows = 0
+        self._index_lock = threading.Lock()
+        self._comment_index = None
+        self._update_task = BackgroundTask(f"update-{self.snapshot.name}", self.update)
+        self._refresh_task = BackgroundTask(f"refresh-{self.snapshot.name}", self.refresh)
+
+    def current(self):
+        """Données servies ; une version plus récente de l'instantané est intégrée en arrière-plan"""
+        data = self._data
+        if data is None:
+            return self.update()
+        if self.snapshot.version() != self._version:
+            self._update_task.start()
+        return data
+
+    def update(self):
+        """Intégrer la dernière version de l'instantané (bloquant) et la servir"""
+        with self._lock:
+            if self._data is None and not self.snapshot.exists():
+                self.snapshot.refresh()
+            version = self.snapshot.version()
+            if self._data is not None and version == self._version:
+                return self._data
+
+            meta = self.snapshot.read_meta()
+            first_load = self._data is None
+            shared_version = f"{meta.get('generation')}-{meta['rows']}-{SHARED_FORMAT}"
+            data = self._attach(shared_version)
+            if data is None:
+                if not first_load and meta.get('generation') == self._generation and meta['rows'] >= self._rows:
+                    data = ExperienceData.from_chunks(self.snapshot.iter_since(self._rows, meta), base=self._data)
+                else:
+                    data = ExperienceData.from_chunks(self.snapshot.iter_since(0, meta))
+                data = self._publish(shared_version, data, meta)
+            data = dataclasses.replace(data, version=(meta.get('generation'), meta['rows']))
+            self._version = version
+            self._generation = meta.get('generation')
+            self._rows = meta['rows']
+            self._data = data
+        if first_load:
+            self.refresh_in_background()
+        elif self._comment_index is not None:
+            # Index des commentaires tenu à jour avec les données (hors requêtes
+            # quand la mise à jour se fait en arrière-plan)
+            self.comment_index()
+        return data
+
+    def _attach(self, shared_version):
+        """Version déjà publiée par un processus (None si absente ou illisible)"""
+        if self.shared.read_pointer().get('version') != shared_version:
+            return None
+        try:
+            return ExperienceData.attach(self.shared.path(shared_version))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _publish(self, shared_version, data, meta):
+        """Publier une version calculée puis la servir depuis sa projection en mémoire"""
+        try:
+            self.shared.publish(shared_version, data.write, {
+                'generation': meta.get('generation'),
+                'rows': meta['rows']
+            })
+            return ExperienceData.attach(self.shared.path(shared_version))
+        except OSError as e:
+            logger.warning("Publication des expériences impossible : %s", e)
+            return data
+
+    @property
+    def version(self):
+        """Version des données servies (génération de l'instantané, nombre de lignes)"""
+        return self._generation, self._rows
+
+    def refresh(self):
+        """Revalider l'instantané puis intégrer la nouvelle version (bloquant)"""
+        self.snapshot.refresh()
+        return self.update()
+
+    def refresh_in_background(self):
+        """Revalider l'instantané et recalculer les agrégats sans bloquer"""
+        return self._refresh_task.start()
+
+    def comment_index(self):
+        """Index inversé des commentaires, complété avec les lignes ajoutées à l'instantané
+
+        Construit au premier appel ; une nouvelle génération le reconstruit.
+        """
+        with self._index_lock:
+            meta = self.snapshot.read_meta()
+            rows = meta.get('rows', 0)
+            index = self._comment_index
+            if index is None or index.generation != meta.get('generation') or index.rows > rows:
+                index = CommentIndex(meta.get('generation'))
+            if index.rows < rows:
+                index.update(self.snapshot.iter_since(index.rows, meta, columns=INDEX_COLUMNS))
+            self._comment_index = index
+        return index
+
+
+def memory_report(source=EXPERIENCES_SOURCE):
+    """Empreinte mémoire (octets) de l'export brut et de sa représentation compacte"""
+    raw = pd.read_csv(source)
+    trips = normalize_trips(pd.read_csv(source, **READ_OPTIONS))
+    return {
+        'rows': len(raw),
+        'raw': memory_usage(raw),
+        'trips': memory_usage(compact_trips(trips).drop(columns='commentaires')),
+        'aggregates': read_experiences(source).memory_usage(),
+        'comments': memory_usage(trips[['commentaires']])
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outils sur l'export des expériences")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    memory_parser = subparsers.add_parser('memory', help="comparer l'empreinte mémoire brute et compacte")
+    memory_parser.add_argument('--source', default=EXPERIENCES_SOURCE, help="export CSV (URL ou fichier)")
+    args = parser.parse_args(argv)
+
+    report = memory_report(args.source)
+    print(f"📊 {report['rows']} trajets")
+    print(f"  Export brut (toutes colonnes, types par défaut) : {report['raw'] / 1e6:.2f} Mo")
+    print(f"  Trajets compacts (un bloc à la fois) : {report['trips'] / 1e6:.2f} Mo")
+    print(f"  Agrégats gardés en mémoire : {report['aggregates'] / 1e6:.2f} Mo")
+    print(f"  Commentaires (lus à la demande) : {report['comments'] / 1e6:.2f} Mo")
+
+
+if __name__ == "__main__":
+    main()
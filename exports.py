@@ -0,0 +1,231 @@
+"""Exports du catalogue, des recommandations et des agrégats par modèle
+
+Les fichiers (CSV, Parquet ou Excel) ne sont produits qu'à la demande, puis
+gardés sur disque sous une clé qui inclut la version des données : un même
+export demandé de nouveau, par la même session ou une autre, est servi tel
+quel. Les tables sont écrites par blocs de EXPORT_ROWS lignes directement
+dans le fichier, sans construire tout le contenu en mémoire. Le service HTTP
+envoie ensuite le fichier par morceaux ; dans l'application, Streamlit
+charge le fichier entier en mémoire pour le téléchargement (au clic seulement).
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from recommendation import criteria_key
+from settings import CACHE_DIR
+
+EXPORT_DIR = os.path.join(CACHE_DIR, 'exports')
+
+# Lignes écrites à la fois
+EXPORT_ROWS = 10_000
+
+# Fichiers gardés dans le cache des exports (les plus anciens sont supprimés)
+MAX_EXPORTS = 32
+
+# Verrous de construction (un fichier est associé à l'un d'eux par hachage)
+BUILD_LOCKS = 16
+
+# Format : (extension, type MIME, libellé)
+FORMATS = {
+    'csv': ('csv', 'text/csv', "CSV"),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', "Parquet"),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', "Excel")
+}
+
+RECOMMENDATION_COLUMNS = ['rank', 'vehicle', 'compatible', 'score', 'sort_key', 'matches', 'mismatches']
+
+
+def _chunks(df, rows=EXPORT_ROWS):
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows]
+
+
+# --- Tables exportées (blocs de DataFrame) ---------------------------------
+
+def catalogue_frames(catalogue):
+    """Caractéristiques de tous les véhicules"""
+    yield from _chunks(catalogue.specs)
+
+
+def recommendation_frames(result, tri_par):
+    """Véhicules compatibles dans l'ordre demandé (avec les raisons), puis véhicules écartés"""
+    ranked = result.sorted(tri_par)
+    keys = dict(zip((r.index for r in result.recommendations), result.keys(tri_par)))
+    for start in range(0, len(ranked), EXPORT_ROWS):
+        yield pd.DataFrame([
+            {
+                'rank': rank,
+                'vehicle': reco.name,
+                'compatible': True,
+                'score': reco.score,
+                'sort_key': keys[reco.index],
+                'matches': ' ; '.join(reco.matches),
+                'mismatches': ' ; '.join(reco.mismatches)
+            }
+            for rank, reco in enumerate(ranked[start:start + EXPORT_ROWS], start=start + 1)
+        ], columns=RECOMMENDATION_COLUMNS)
+    filtered_out = result.filtered_out
+    for start in range(0, len(filtered_out), EXPORT_ROWS):
+        yield pd.DataFrame([
+            {
+                'rank': None,
+                'vehicle': name,
+                'compatible': False,
+                'score': None,
+                'sort_key': None,
+                'matches': '',
+                'mismatches': ' ; '.join(reasons)
+            }
+            for name, reasons in filtered_out[start:start + EXPORT_ROWS]
+        ], columns=RECOMMENDATION_COLUMNS)
+
+
+def aggregate_frames(data):
+    """Agrégats par modèle : trajets, satisfaction, distances, bilans, score d'expérience"""
+    by_model = data.by_model
+    scores, default = data.ranking_scores()
+    table = pd.DataFrame({
+        'Model': by_model.index.astype(object),
+        'trips': by_model['trips'].to_numpy(),
+        'satisfaction': by_model['satisfaction'].round(1).to_numpy(),
+        'total_distance': by_model['total_distance'].round(1).to_numpy(),
+        'mean_distance': (by_model['total_distance'] / by_model['trips'].where(by_model['trips'] > 0)).round(2).to_numpy(),
+        'experience_score': [round(scores.get(model, default), 1) for model in by_model.index]
+    })
+    bilans = data.bilan_counts.reindex(by_model.index, fill_value=0)
+    for bilan in bilans.columns:
+        table[f"bilan_{bilan}"] = bilans[bilan].to_numpy()
+    table['comments'] = [' | '.join(comments) for comments in by_model['comments']]
+    yield from _chunks(table)
+
+
+# --- Écriture par blocs ------------------------------------------------------
+
+def write_csv(frames, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        header = True
+        for frame in frames:
+            frame.to_csv(f, index=False, header=header)
+            header = False
+
+
+def _parquet_schema(schema):
+    """Schéma commun aux blocs : une colonne vide dans le premier bloc devient du texte"""
+    return pa.schema([
+        field.with_type(pa.large_string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    ], metadata=schema.metadata)
+
+
+def write_parquet(frames, path):
+    """Un groupe de lignes par bloc"""
+    writer = None
+    try:
+        for frame in frames:
+            if writer is None:
+                schema = _parquet_schema(pa.Schema.from_pandas(frame, preserve_index=False))
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table(pa.table({}), path)
+
+
+def _cell(value):
+    """Valeur acceptée par openpyxl (types NumPy convertis, valeurs manquantes vides)"""
+    if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, str):
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        return ILLEGAL_CHARACTERS_RE.sub('', value)
+    return value
+
+
+def write_xlsx(frames, path):
+    """Classeur en écriture seule : les lignes sont écrites au fur et à mesure"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Export')
+    header = True
+    for frame in frames:
+        if header:
+            sheet.append([str(col) for col in frame.columns])
+            header = False
+        for row in frame.itertuples(index=False, name=None):
+            sheet.append([_cell(value) for value in row])
+    workbook.save(path)
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'xlsx': write_xlsx}
+
+
+class ExportCache:
+    """Fichiers d'export indexés par (type, version des données, format)"""
+
+    def __init__(self, directory=EXPORT_DIR, keep=MAX_EXPORTS):
+        self.directory = directory
+        self.keep = keep
+        self._building = tuple(threading.Lock() for _ in range(BUILD_LOCKS))
+
+    def path(self, kind, version, fmt, frames):
+        """Chemin de l'export, écrit au premier appel par frames() (itérateur de DataFrame)
+
+        version identifie les données exportées ; None désactive la réutilisation
+        (le fichier est réécrit à chaque appel).
+        """
+        if fmt not in WRITERS:
+            raise ValueError(f"Format d'export inconnu : {fmt!r} (attendu : {', '.join(FORMATS)})")
+        digest = hashlib.sha256(json.dumps([kind, version], default=str).encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(self.directory, f"{kind}-{digest}.{FORMATS[fmt][0]}")
+
+        # Un seul calcul à la fois par fichier ; les autres demandes l'attendent
+        # (nombre de verrous fixe : deux fichiers peuvent partager le leur)
+        with self._building[int(digest, 16) % len(self._building)]:
+            if version is not None and os.path.exists(path):
+                os.utime(path)
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}-{threading.get_ident()}"
+            try:
+                WRITERS[fmt](frames(), tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self.cleanup()
+        return path
+
+    def cleanup(self):
+        """Supprimer les exports les plus anciens au-delà de keep"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if '.tmp' not in entry.name]
+            entries.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        except OSError:
+            return
+        for entry in entries[self.keep:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def catalogue(self, catalogue, fmt):
+        return self.path('catalogue', catalogue.version, fmt, lambda: catalogue_frames(catalogue))
+
+    def recommendations(self, catalogue, result, criteria, tri_par, data_version, fmt):
+        version = (catalogue.version, data_version, criteria_key(criteria), tri_par)
+        return self.path('recommandations', version, fmt, lambda: recommendation_frames(result, tri_par))
+
+    def aggregates(self, data, fmt):
+        return self.path('agregats', data.version, fmt, lambda: aggregate_frames(data))
@@ -0,0 +1,241 @@
+"""Treillis précalculé des recommandations
+
+Toutes les combinaisons des critères de la barre latérale (pédalage, enfants,
+adultes, chargement, couverture, terrain) sont évaluées au chargement du
+catalogue. Chaque critère contribuant indépendamment au score, les pénalités
+et la compatibilité sont calculées par axe puis combinées par diffusion
+NumPy ; le classement de chaque cellule est ensuite stocké dans des tableaux
+denses. Répondre à une requête devient une simple indexation.
+
+Une page (LatticeView) ne construit les Recommendation que des véhicules
+affichés ; result() construit le résultat complet (export, service) et ne
+fait donc l'économie que du calcul des scores.
+"""
+import time
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+
+from recommendation import (EXPERIENCE_SORT, NB_ADULTES_OPTIONS, NB_ENFANTS_OPTIONS,
+                            SPEC_SORT_OPTIONS, Recommendation, RecommendationResult,
+                            criteria_key, experience_keys, sort_values)
+from schema import CHARGEMENT_OPTIONS, TERRAIN_KEYWORDS
+from scoring import active_rules, evaluate_rule
+
+# Axes du treillis, dans l'ordre des règles (et donc des messages)
+AXES = [
+    ('pedaler', [None, 'OUI', 'NON']),
+    ('nb_enfants', NB_ENFANTS_OPTIONS),
+    ('nb_adultes', NB_ADULTES_OPTIONS),
+    ('chargement', [None] + CHARGEMENT_OPTIONS),
+    ('couverture', [None, "Totalement couvert", "Partiellement couvert"]),
+    ('territoire', [None] + list(TERRAIN_KEYWORDS))
+]
+
+# Statut d'un véhicule pour un critère
+NEUTRAL, MATCH, MISMATCH = 0, 1, 2
+
+
+@dataclass
+class _Axis:
+    """Contributions d'un critère pour chacune de ses valeurs (valeur × véhicule)"""
+    name: str
+    values: list
+    penalty: np.ndarray
+    compatible: np.ndarray
+    status: np.ndarray
+    messages: list
+
+
+def _build_axis(matrices, name, values):
+    n_vehicles = len(matrices)
+    penalty = np.zeros((len(values), n_vehicles), dtype=np.int16)
+    compatible = np.ones((len(values), n_vehicles), dtype=bool)
+    status = np.full((len(values), n_vehicles), NEUTRAL, dtype=np.int8)
+    messages = []
+    for k, value in enumerate(values):
+        rules = active_rules({name: value})
+        messages.append((None, None))
+        for rule in rules:
+            masks = evaluate_rule(matrices, rule)
+            if masks is None:
+                continue
+            ok, fail = masks
+            penalty[k, fail] += rule.penalty
+            if rule.eliminatory:
+                compatible[k] &= ~fail
+            status[k, ok] = MATCH
+            status[k, fail] = MISMATCH
+            messages[k] = (rule.match_message, rule.mismatch_message)
+    return _Axis(name, list(values), penalty, compatible, status, messages)
+
+
+class CriteriaLattice:
+    """Classements précalculés pour chaque cellule du treillis des critères"""
+
+    def __init__(self, catalogue):
+        start = time.perf_counter()
+        matrices = catalogue.matrices
+        self.names = list(matrices.names)
+        self.version = catalogue.version
+        self.axes = [_build_axis(matrices, name, values) for name, values in AXES]
+        self.shape = tuple(len(axis.values) for axis in self.axes)
+        self._positions = [
+            {value: k for k, value in enumerate(axis.values)} for axis in self.axes
+        ]
+        n_vehicles = len(self.names)
+        n_cells = int(np.prod(self.shape))
+
+        # Diffusion : (cellules, véhicules)
+        penalty = np.zeros(self.shape + (n_vehicles,), dtype=np.int16)
+        compatible = np.ones(self.shape + (n_vehicles,), dtype=bool)
+        for a, axis in enumerate(self.axes):
+            expand = [1] * len(self.shape) + [n_vehicles]
+            expand[a] = len(axis.values)
+            penalty += axis.penalty.reshape(expand)
+            compatible &= axis.compatible.reshape(expand)
+        self.scores = np.maximum(0, 100 - penalty).astype(np.uint8).reshape(n_cells, n_vehicles)
+        self.compatible = compatible.reshape(n_cells, n_vehicles)
+        self.n_compatible = self.compatible.sum(axis=1).astype(np.int32)
+
+        # Classements : véhicules compatibles en tête, tri stable décroissant
+        # (le tri par retours d'expérience dépend des données : fait à la lecture)
+        self._sort_values = {option: sort_values(catalogue, option) for option in SPEC_SORT_OPTIONS[1:]}
+        id_dtype = np.int16 if n_vehicles < np.iinfo(np.int16).max else np.int32
+        self.rankings = {}
+        for option in SPEC_SORT_OPTIONS:
+            if option == SPEC_SORT_OPTIONS[0]:
+                keys = np.where(self.compatible, -self.scores.astype(np.int16), np.iinfo(np.int16).max)
+                ranking = np.argsort(keys, axis=1, kind='stable')
+            else:
+                values = np.array(self._sort_values[option], dtype=float)
+                order = np.argsort(-values, kind='stable')
+                ranking = order[np.argsort(~self.compatible[:, order], axis=1, kind='stable')]
+            self.rankings[option] = ranking.astype(id_dtype)
+
+        self.build_seconds = time.perf_counter() - start
+
+    @property
+    def n_cells(self):
+        return len(self.scores)
+
+    @property
+    def nbytes(self):
+        """Mémoire occupée par les tableaux du treillis (octets)"""
+        arrays = [self.scores, self.compatible, self.n_compatible, *self.rankings.values()]
+        for axis in self.axes:
+            arrays += [axis.penalty, axis.compatible, axis.status]
+        return sum(a.nbytes for a in arrays)
+
+    def describe(self):
+        """Taille et coût de construction du treillis"""
+        return {
+            'vehicles': len(self.names),
+            'cells': self.n_cells,
+            'build_seconds': self.build_seconds,
+            'nbytes': self.nbytes
+        }
+
+    def cell(self, criteria):
+        """Indice de la cellule correspondant aux critères (None hors treillis)"""
+        key = criteria_key(criteria)
+        positions = []
+        for value, index in zip(key, self._positions):
+            if value not in index:
+                return None
+            positions.append(index[value])
+        return int(np.ravel_multi_index(positions, self.shape))
+
+    def lookup(self, criteria, tri_par=SPEC_SORT_OPTIONS[0]):
+        """(identifiants classés, scores) des véhicules compatibles, ou None hors treillis
+
+        Les tris absents du treillis (EXPERIENCE_SORT) retombent sur le score.
+        """
+        cell = self.cell(criteria)
+        if cell is None:
+            return None
+        ids = self.rankings.get(tri_par, self.rankings[SPEC_SORT_OPTIONS[0]])[cell, :self.n_compatible[cell]]
+        return ids, self.scores[cell, ids]
+
+    def _messages(self, cell, vehicle):
+        positions = np.unravel_index(cell, self.shape)
+        matches, mismatches = [], []
+        for axis, k in zip(self.axes, positions):
+            status = axis.status[k, vehicle]
+            if status == MATCH:
+                matches.append(axis.messages[k][0])
+            elif status == MISMATCH:
+                mismatches.append(axis.messages[k][1])
+        return tuple(matches), tuple(mismatches)
+
+    def _recommendations(self, cell, ids):
+        return tuple(
+            Recommendation(self.names[i], int(self.scores[cell, i]), *self._messages(cell, i), int(i))
+            for i in ids
+        )
+
+    def _filtered_out(self, cell):
+        return tuple(
+            (self.names[i], self._messages(cell, i)[1])
+            for i in np.flatnonzero(~self.compatible[cell])
+        )
+
+    def view(self, criteria):
+        """Lecture paresseuse de la cellule (LatticeView), ou None hors treillis"""
+        cell = self.cell(criteria)
+        return None if cell is None else LatticeView(self, cell)
+
+    def result(self, criteria, experience=None):
+        """Résultat complet (comme recommend), ou None hors treillis"""
+        cell = self.cell(criteria)
+        if cell is None:
+            return None
+        recommendations = self._recommendations(cell, np.flatnonzero(self.compatible[cell]))
+        by_index = {r.index: r for r in recommendations}
+        sort_keys = {SPEC_SORT_OPTIONS[0]: tuple(r.score for r in recommendations)}
+        for option, values in self._sort_values.items():
+            sort_keys[option] = tuple(values[r.index] for r in recommendations)
+        if experience is not None:
+            sort_keys[EXPERIENCE_SORT] = experience_keys(recommendations, experience)
+        # Classements déjà disponibles : aucun tri à la lecture
+        orderings = {
+            option: tuple(by_index[i] for i in ranking[cell, :self.n_compatible[cell]])
+            for option, ranking in self.rankings.items()
+        }
+        return RecommendationResult(
+            recommendations=recommendations,
+            sort_keys=sort_keys,
+            filtered_out=self._filtered_out(cell),
+            orderings=orderings
+        )
+
+
+class LatticeView:
+    """Cellule du treillis lue comme un RecommendationResult (len, top, filtered_out)
+
+    Seuls les véhicules demandés par top() deviennent des Recommendation ;
+    les véhicules écartés ne sont décrits qu'à la première lecture de
+    filtered_out. Les tris absents du treillis (EXPERIENCE_SORT) ne sont pas
+    disponibles : utiliser CriteriaLattice.result.
+    """
+
+    def __init__(self, lattice, cell):
+        self.lattice = lattice
+        self.cell = cell
+
+    def __len__(self):
+        return int(self.lattice.n_compatible[self.cell])
+
+    @property
+    def n_filtered_out(self):
+        return len(self.lattice.names) - len(self)
+
+    @cached_property
+    def filtered_out(self):
+        return self.lattice._filtered_out(self.cell)
+
+    def top(self, tri_par, k):
+        """Les k premiers véhicules dans l'ordre demandé"""
+        ids = self.lattice.rankings[tri_par][self.cell, :min(k, len(self))]
+        return self.lattice._recommendations(self.cell, ids)
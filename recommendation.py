@@ -0,0 +1,250 @@
+"""Recommandations : scoring du catalogue, filtrage et tri des résultats
+
+Les critères de la barre latérale forment un petit espace discret ; les
+résultats (déjà triés pour chaque option de tri) sont donc mémorisés dans un
+cache LRU borné, indexé par la version du catalogue et une clé canonique des
+critères.
+"""
+import heapq
+import numbers
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from schema import CHARGEMENT_OPTIONS, COUVERTURE_KEYWORDS, TERRAIN_KEYWORDS
+from scoring import score_catalogue
+
+# Tris qui ne dépendent que du catalogue
+SPEC_SORT_OPTIONS = ["Score de compatibilité", "Vitesse max", "Autonomie"]
+
+# Tri mêlant le score de compatibilité et les retours d'expérience
+EXPERIENCE_SORT = "Compatibilité et retours d'expérience"
+SORT_OPTIONS = SPEC_SORT_OPTIONS + [EXPERIENCE_SORT]
+
+# Part du score d'expérience (experiences.experience_scores) dans le tri EXPERIENCE_SORT
+EXPERIENCE_WEIGHT = 0.3
+
+# Choix proposés dans la barre latérale
+PEDALER_OPTIONS = ["Indifférent", "Oui, je veux pédaler", "Non, sans effort"]
+NB_ENFANTS_OPTIONS = [0, 1, 2, 3, 4]
+NB_ADULTES_OPTIONS = [0, 1, 2, 3]
+CHARGEMENT_CHOICES = ["Aucun besoin spécifique"] + CHARGEMENT_OPTIONS
+COUVERTURE_OPTIONS = ["Indifférent"] + list(COUVERTURE_KEYWORDS) + ["Non couvert"]
+TERRITOIRE_OPTIONS = ["Indifférent"] + list(TERRAIN_KEYWORDS)
+CAS_USAGE_OPTIONS = ["Domicile-Travail", "Courses", "Loisirs", "Médical", "École"]
+
+CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class Recommendation:
+    """Véhicule évalué (index : position de la ligne dans le catalogue)"""
+    name: str
+    score: int
+    matches: tuple
+    mismatches: tuple
+    index: int
+
+
+@dataclass(frozen=True)
+class RecommendationResult:
+    """Véhicules compatibles (ordre du catalogue) avec leurs clés de tri, et véhicules écartés
+
+    orderings contient les classements complets fournis à la construction
+    (treillis) ; les autres sont calculés à chaque appel de sorted(), sans
+    être mémorisés : le résultat est partagé entre sessions et threads, il
+    n'est jamais modifié. top() se contente d'une sélection partielle.
+    """
+    recommendations: tuple
+    sort_keys: dict
+    filtered_out: tuple
+    orderings: dict = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def n_filtered_out(self):
+        return len(self.filtered_out)
+
+    def keys(self, tri_par):
+        """Clés de tri d'une option, alignées sur recommendations"""
+        return self.sort_keys.get(tri_par, self.sort_keys[SORT_OPTIONS[0]])
+
+    def sorted(self, tri_par):
+        """Véhicules compatibles dans l'ordre demandé (tri stable décroissant)"""
+        if tri_par in self.orderings:
+            return self.orderings[tri_par]
+        keys = self.keys(tri_par)
+        order = sorted(range(len(self.recommendations)), key=keys.__getitem__, reverse=True)
+        return tuple(self.recommendations[i] for i in order)
+
+    def top(self, tri_par, k):
+        """Les k premiers véhicules dans l'ordre demandé (sélection partielle)"""
+        if tri_par in self.orderings or k >= len(self.recommendations):
+            return self.sorted(tri_par)[:k]
+        # heapq.nlargest est équivalent à sorted(..., reverse=True)[:k], égalités comprises
+        keys = self.keys(tri_par)
+        order = heapq.nlargest(k, range(len(self.recommendations)), key=keys.__getitem__)
+        return tuple(self.recommendations[i] for i in order)
+
+    def __len__(self):
+        return len(self.recommendations)
+
+
+def _choice(value, options, label):
+    """Valeur d'un critère à options (None si indifférent) ; lève ValueError si inconnue"""
+    if value is None or value == '' or value == options[0]:
+        return None
+    if value not in options:
+        raise ValueError(f"{label} inconnu : {value!r} (attendu : {', '.join(options)})")
+    return value
+
+
+def _count(value, options, label):
+    """Nombre de passagers (0 si vide) ; lève ValueError s'il n'est pas un entier proposé"""
+    if value is None or value == '':
+        return 0
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, numbers.Integral) or value not in options:
+        raise ValueError(f"{label} invalide : {value!r} (attendu : {', '.join(map(str, options))})")
+    return int(value)
+
+
+def build_criteria(pedaler=None, nb_enfants=0, nb_adultes=0, chargement=None,
+                   couverture=None, territoire=None, cas_usage=()):
+    """Critères du moteur à partir des choix de la barre latérale
+
+    pedaler accepte aussi 'OUI' / 'NON' ; les valeurs vides valent
+    « indifférent ». Lève ValueError pour une valeur inconnue.
+    """
+    if pedaler in ('OUI', 'NON'):
+        pedaler_value = pedaler
+    else:
+        pedaler_value = _choice(pedaler, PEDALER_OPTIONS, "Choix de pédalage")
+        if pedaler_value is not None:
+            pedaler_value = 'OUI' if 'Oui' in pedaler_value else 'NON'
+    return {
+        'pedaler': pedaler_value,
+        'nb_enfants': _count(nb_enfants, NB_ENFANTS_OPTIONS, "Nombre d'enfants"),
+        'nb_adultes': _count(nb_adultes, NB_ADULTES_OPTIONS, "Nombre d'adultes"),
+        'chargement': _choice(chargement, CHARGEMENT_CHOICES, "Type de chargement"),
+        'couverture': _choice(couverture, COUVERTURE_OPTIONS, "Couverture"),
+        'territoire': _choice(territoire, TERRITOIRE_OPTIONS, "Relief"),
+        'cas_usage': list(cas_usage or [])
+    }
+
+
+def criteria_key(criteria):
+    """Clé canonique : deux critères donnant le même scoring ont la même clé"""
+    pedaler = criteria.get('pedaler')
+    couverture = criteria.get('couverture')
+    return (
+        pedaler if pedaler in ('OUI', 'NON') else None,
+        int(criteria.get('nb_enfants') or 0),
+        int(criteria.get('nb_adultes') or 0),
+        criteria.get('chargement') or None,
+        couverture if couverture in ("Totalement couvert", "Partiellement couvert") else None,
+        criteria.get('territoire') or None
+    )
+
+
+def sort_values(catalogue, tri_par):
+    """Valeurs numériques de tri (vitesse ou autonomie) de chaque véhicule"""
+    column = catalogue.schema.vitesse if tri_par == "Vitesse max" else catalogue.schema.autonomie
+    return [float(value or 0) for value in catalogue.specs[column].tolist()]
+
+
+def experience_keys(recommendations, experience):
+    """Score de compatibilité mêlé au score d'expérience de chaque modèle (agrégats précalculés)"""
+    scores, default = experience.ranking_scores()
+    return tuple(
+        (1 - EXPERIENCE_WEIGHT) * r.score + EXPERIENCE_WEIGHT * scores.get(r.name, default)
+        for r in recommendations
+    )
+
+
+def result_sort_keys(catalogue, recommendations, experience=None):
+    """Clés de tri de chaque option, alignées sur la liste des recommandations
+
+    Sans données d'expérience, le tri EXPERIENCE_SORT retombe sur le score de
+    compatibilité.
+    """
+    vitesse = sort_values(catalogue, "Vitesse max")
+    autonomie = sort_values(catalogue, "Autonomie")
+    keys = {
+        "Score de compatibilité": tuple(r.score for r in recommendations),
+        "Vitesse max": tuple(vitesse[r.index] for r in recommendations),
+        "Autonomie": tuple(autonomie[r.index] for r in recommendations)
+    }
+    if experience is not None:
+        keys[EXPERIENCE_SORT] = experience_keys(recommendations, experience)
+    return keys
+
+
+def recommend(catalogue, criteria, experience=None):
+    """Évaluer tout le catalogue et séparer les véhicules compatibles des autres
+
+    experience (experiences.ExperienceData) fournit les clés du tri EXPERIENCE_SORT.
+    """
+    result = score_catalogue(catalogue.matrices, criteria)
+    recommendations = []
+    filtered_out = []
+    for i, name in enumerate(catalogue.matrices.names):
+        score, matches, mismatches, is_compatible = result.row(i)
+        if is_compatible:
+            recommendations.append(Recommendation(name, score, tuple(matches), tuple(mismatches), i))
+        else:
+            filtered_out.append((name, tuple(mismatches)))
+
+    return RecommendationResult(
+        recommendations=tuple(recommendations),
+        sort_keys=result_sort_keys(catalogue, recommendations, experience),
+        filtered_out=tuple(filtered_out)
+    )
+
+
+class RecommendationCache:
+    """Cache LRU borné des recommandations, vidé quand les données changent"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, catalogue, criteria, data_version=None, lattice=None, experience=None):
+        """Recommandations pour ces critères (calculées au premier appel)
+
+        Si un treillis précalculé (lattice.CriteriaLattice) est fourni, le
+        résultat y est lu au lieu d'être recalculé. experience doit
+        correspondre à data_version : les clés du tri EXPERIENCE_SORT en
+        dépendent.
+        """
+        version = (catalogue.version, data_version)
+        key = criteria_key(criteria)
+        with self._lock:
+            if version != self._data_version:
+                self._entries.clear()
+                self._data_version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        result = None
+        if lattice is not None and lattice.version == catalogue.version:
+            result = lattice.result(criteria, experience)
+        if result is None:
+            result = recommend(catalogue, criteria, experience)
+        with self._lock:
+            if version == self._data_version:
+                self._entries[key] = result
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,104 @@
+"""Rafraîchissement des données en arrière-plan
+
+Les rechargements (téléchargement de l'export, recalcul des agrégats,
+recompilation du catalogue) se font dans des threads : les requêtes sont
+servies avec la version précédente jusqu'à ce que la nouvelle soit prête, puis
+celle-ci la remplace d'un bloc.
+
+BackgroundRefresher relance ces rechargements périodiquement
+(VELI_REFRESH_INTERVAL secondes) ou à la demande (trigger).
+"""
+import logging
+import threading
+import time
+
+from settings import REFRESH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTask:
+    """Fonction exécutée dans un thread, une seule exécution à la fois"""
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Lancer fn si elle ne tourne pas déjà ; retourne le thread (None s'il tournait)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return None
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def _run(self):
+        try:
+            self.fn()
+        except Exception as e:
+            logger.warning("%s : échec en arrière-plan (%s)", self.name, e)
+
+    @property
+    def running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def join(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+class BackgroundRefresher:
+    """Rechargements périodiques ou à la demande, dans un thread dédié
+
+    tasks est une liste de (nom, fonction) ; une erreur est journalisée et
+    n'empêche pas les autres rechargements (la version précédente reste servie).
+    """
+
+    def __init__(self, tasks, interval=REFRESH_INTERVAL):
+        self.tasks = list(tasks)
+        self.interval = interval
+        self.last_run = None
+        self.errors = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='veli-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def trigger(self):
+        """Demander un rechargement immédiat (sans attendre qu'il se termine)"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            # Sans intervalle, seuls les rechargements demandés sont faits
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.run_once()
+
+    def run_once(self):
+        """Exécuter chaque rechargement, dans ce thread"""
+        for name, fn in self.tasks:
+            start = time.perf_counter()
+            try:
+                fn()
+                self.errors.pop(name, None)
+                logger.info("Rechargement %s : %.0f ms", name, (time.perf_counter() - start) * 1000)
+            except Exception as e:
+                self.errors[name] = str(e)
+                logger.warning("Rechargement %s impossible : %s", name, e)
+        self.last_run = time.time()
@@ -0,0 +1,181 @@
+"""Assouplissements des critères et véhicules les plus proches
+
+Quand aucun véhicule n'est compatible, les critères éliminatoires actifs
+(pédalage, enfants, adultes) sont assouplis pas à pas : moins de passagers,
+puis critère ignoré. Les caractéristiques du catalogue sont précalculées en
+ensembles de bits (bit i : véhicule i) ; tester une combinaison d'assouplissements
+revient à quelques OU et ET sur ces entiers, sans rescorer le catalogue.
+"""
+import heapq
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+
+from scoring import active_rules
+
+# Assouplissements proposés au plus
+MAX_RELAXATIONS = 3
+
+# Véhicules les plus proches proposés
+N_NEAR_MISSES = 5
+
+
+def _bits(mask):
+    """Entier dont le bit i vaut mask[i]"""
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def _indices(bits):
+    """Positions des bits à 1, dans l'ordre croissant"""
+    indices = []
+    while bits:
+        low = bits & -bits
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
+
+
+class CriteriaBitsets:
+    """Caractéristiques du catalogue en ensembles de bits (positif, renseigné)"""
+
+    def __init__(self, matrices):
+        self.names = list(matrices.names)
+        self.features = matrices.features
+        self.all = (1 << len(self.names)) - 1
+        self.positive = [_bits(matrices.positive[:, j]) for j in range(matrices.positive.shape[1])]
+        self.has_value = [_bits(matrices.has_value[:, j]) for j in range(matrices.has_value.shape[1])]
+
+    def __len__(self):
+        return len(self.names)
+
+    def fail_bits(self, rule):
+        """Véhicules qui ne respectent pas une règle (même logique que scoring.evaluate_rule)"""
+        j = self.features.get(rule.key)
+        if j is None:
+            return self.all if rule.missing_is_mismatch else 0
+        ok = self.positive[j] if rule.expect_positive else self.all & ~self.positive[j]
+        fail = self.all & ~ok
+        if rule.requires_value:
+            fail &= self.has_value[j]
+        return fail
+
+    def eliminated_bits(self, criteria):
+        """Véhicules écartés par les critères éliminatoires"""
+        fail = 0
+        for rule in active_rules(criteria):
+            if rule.eliminatory:
+                fail |= self.fail_bits(rule)
+        return fail
+
+
+@dataclass(frozen=True)
+class Relaxation:
+    """Critères assouplis : changements ((champ, avant, après), ...) et véhicules compatibles"""
+    changes: tuple
+    criteria: dict
+    vehicles: tuple
+
+    def describe(self):
+        return " et ".join(describe_change(*change) for change in self.changes)
+
+
+@dataclass(frozen=True)
+class NearMiss:
+    """Véhicule écarté, classé par critères éliminatoires manqués puis pénalité"""
+    name: str
+    index: int
+    score: int
+    unmet: tuple
+
+
+def describe_change(field, before, after):
+    """Libellé d'un assouplissement"""
+    if field == 'pedaler':
+        return "pédalage indifférent"
+    label = 'enfant(s)' if field == 'nb_enfants' else 'adulte(s)'
+    if after == 0:
+        return f"sans {label.replace('(s)', '')} à transporter"
+    return f"{after} {label} au lieu de {before}"
+
+
+def _levels(criteria):
+    """Valeurs possibles de chaque critère éliminatoire actif, de la plus stricte à la plus souple"""
+    levels = []
+    if criteria.get('pedaler') in ('OUI', 'NON'):
+        levels.append(('pedaler', (criteria['pedaler'], None)))
+    for field in ('nb_enfants', 'nb_adultes'):
+        n = int(criteria.get(field) or 0)
+        if n > 0:
+            levels.append((field, tuple(range(n, -1, -1))))
+    return levels
+
+
+def relaxations(bitsets, criteria, limit=MAX_RELAXATIONS):
+    """Assouplissements minimaux qui rendent au moins un véhicule compatible
+
+    Une combinaison est minimale si aucune autre, moins souple sur chaque
+    critère, ne suffit. Les combinaisons sont classées par nombre de critères
+    modifiés, ampleur des changements puis nombre de véhicules retrouvés.
+    """
+    levels = _levels(criteria)
+    # Véhicules écartés par chaque valeur de chaque critère, seul
+    fails = [
+        [bitsets.eliminated_bits({field: value}) for value in values]
+        for field, values in levels
+    ]
+    valid = []
+    for steps in product(*(range(len(values)) for _, values in levels)):
+        if not any(steps):
+            continue
+        eliminated = 0
+        for level, step in zip(fails, steps):
+            eliminated |= level[step]
+        compatible = bitsets.all & ~eliminated
+        if compatible:
+            valid.append((steps, compatible))
+
+    minimal = [
+        (steps, compatible) for steps, compatible in valid
+        if not any(other != steps and all(o <= s for o, s in zip(other, steps)) for other, _ in valid)
+    ]
+    minimal.sort(key=lambda item: (
+        sum(1 for step in item[0] if step), sum(item[0]), -item[1].bit_count()
+    ))
+
+    results = []
+    for steps, compatible in minimal[:limit]:
+        changes = tuple(
+            (field, values[0], values[step])
+            for (field, values), step in zip(levels, steps) if step
+        )
+        relaxed = dict(criteria)
+        relaxed.update({field: after for field, _, after in changes})
+        results.append(Relaxation(
+            changes=changes,
+            criteria=relaxed,
+            vehicles=tuple(bitsets.names[i] for i in _indices(compatible))
+        ))
+    return results
+
+
+def near_misses(bitsets, criteria, k=N_NEAR_MISSES):
+    """Véhicules écartés les plus proches : le moins de critères éliminatoires manqués, puis la plus faible pénalité"""
+    rules = [(rule, bitsets.fail_bits(rule)) for rule in active_rules(criteria)]
+    eliminated = 0
+    for rule, fail in rules:
+        if rule.eliminatory:
+            eliminated |= fail
+
+    candidates = []
+    for i in _indices(eliminated):
+        bit = 1 << i
+        failed = [rule for rule, fail in rules if fail & bit]
+        unmet = tuple(rule.mismatch_message for rule in failed if rule.eliminatory)
+        penalty = sum(rule.penalty for rule in failed)
+        candidates.append((len(unmet), penalty, i, unmet))
+
+    return [
+        NearMiss(name=bitsets.names[i], index=i, score=max(0, 100 - penalty), unmet=unmet)
+        for _, penalty, i, unmet in heapq.nsmallest(k, candidates)
+    ]
@@ -0,0 +1,116 @@
+"""Schéma du tableur des caractéristiques véhicules
+
+Les champs logiques (pédalage, passagers, chargement, couverture, terrain...)
+sont associés une seule fois aux colonnes physiques de la feuille
+'Caractéristiques Véhicules'. Une colonne manquante ou ambiguë lève une
+SchemaError au chargement au lieu de fausser silencieusement le scoring.
+"""
+from dataclasses import dataclass, field
+
+SHEET_NAME = 'Caractéristiques Véhicules'
+
+VEHICLE_COLUMN = 'Véhicule'
+VITESSE_COLUMN = 'Vitesse max (km/h)'
+AUTONOMIE_COLUMN = 'Autonomie (km)'
+REMARQUES_COLUMN = 'Remarques'
+
+CHARGEMENT_OPTIONS = [
+    "Petit sac (< 5kg)",
+    "Sacs courses semaine (10-30kg)",
+    "Charges lourdes (> 100kg)"
+]
+
+COUVERTURE_KEYWORDS = {
+    "Totalement couvert": "totalement",
+    "Partiellement couvert": "partiellement"
+}
+
+TERRAIN_KEYWORDS = {
+    "Plutôt plat": ["plat"],
+    "Vallonné": ["vallonné", "vallonn"],
+    "Montagneux": ["montagneux", "montagne"]
+}
+
+PASSAGER_LABELS = {
+    'enfants': 'Passagers enfants',
+    'adultes': 'Passagers adultes'
+}
+
+
+class SchemaError(ValueError):
+    """Colonne manquante ou ambiguë dans le tableur des caractéristiques"""
+
+
+def _match_one(columns, description, predicate):
+    """Retourner l'unique colonne qui satisfait le prédicat"""
+    found = [col for col in columns if predicate(col.lower())]
+    if not found:
+        raise SchemaError(f"Colonne introuvable : {description}")
+    if len(found) > 1:
+        raise SchemaError(f"Colonne ambiguë pour {description} : {', '.join(found)}")
+    return found[0]
+
+
+def _require(columns, name):
+    """Vérifier la présence d'une colonne au nom exact"""
+    if name not in columns:
+        raise SchemaError(f"Colonne introuvable : '{name}'")
+    return name
+
+
+@dataclass(frozen=True)
+class CatalogueSchema:
+    """Correspondance entre champs logiques et colonnes du tableur"""
+    vehicle: str
+    vitesse: str
+    autonomie: str
+    remarques: str = None
+    features: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Résoudre le schéma à partir des noms de colonnes (lève SchemaError)"""
+        columns = [str(col) for col in columns]
+        features = {}
+
+        features[('pedaler',)] = _match_one(
+            columns, "pédalage (OUI/NON)",
+            lambda c: 'pédaler' in c and ('oui' in c or 'non' in c)
+        )
+
+        for key, label in PASSAGER_LABELS.items():
+            prefix = f"{label} - "
+            counts = {}
+            for col in columns:
+                suffix = col[len(prefix):]
+                if col.startswith(prefix) and suffix.isdigit():
+                    if int(suffix) in counts:
+                        raise SchemaError(f"Colonne ambiguë pour {label} {int(suffix)} : {counts[int(suffix)]}, {col}")
+                    counts[int(suffix)] = col
+            if not counts:
+                raise SchemaError(f"Colonne introuvable : '{prefix}N'")
+            for n, col in counts.items():
+                features[(key, n)] = col
+
+        for option in CHARGEMENT_OPTIONS:
+            features[('chargement', option)] = _require(columns, f"Chargement - {option}")
+
+        for option, keyword in COUVERTURE_KEYWORDS.items():
+            features[('couverture', option)] = _match_one(
+                columns, option.lower(),
+                lambda c: keyword in c and 'couvert' in c
+            )
+
+        for option, keywords in TERRAIN_KEYWORDS.items():
+            features[('territoire', option)] = _match_one(
+                columns, f"terrain {option.lower()}",
+                lambda c: ('terrain' in c or 'adapté' in c) and any(kw in c for kw in keywords)
+            )
+
+        return cls(
+            vehicle=_require(columns, VEHICLE_COLUMN),
+            vitesse=_require(columns, VITESSE_COLUMN),
+            autonomie=_require(columns, AUTONOMIE_COLUMN),
+            remarques=REMARQUES_COLUMN if REMARQUES_COLUMN in columns else None,
+            features=features
+        )
@@ -0,0 +1,197 @@
+"""Moteur de scoring vectorisé des véhicules
+
+Le catalogue est normalisé une seule fois en matrices booléennes NumPy, puis
+tous les véhicules sont évalués en une passe pour un dictionnaire de critères.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+POSITIVE_VALUES = ['OUI', 'X']
+
+
+def is_positive(value):
+    """Vérifier si une valeur est positive (OUI, X, ou oui/x en minuscule)"""
+    return str(value).upper().strip() in POSITIVE_VALUES
+
+
+@dataclass
+class CatalogueMatrices:
+    """Catalogue normalisé : une colonne booléenne par caractéristique logique"""
+    names: list
+    features: dict
+    positive: np.ndarray
+    has_value: np.ndarray
+
+    @classmethod
+    def from_specs(cls, vehicules_specs, schema):
+        """Construire les matrices à partir du tableau des caractéristiques"""
+        features = schema.features
+        n_vehicles = len(vehicules_specs)
+        positive = np.zeros((n_vehicles, len(features)), dtype=bool)
+        has_value = np.zeros((n_vehicles, len(features)), dtype=bool)
+        index = {}
+        for j, (key, col) in enumerate(features.items()):
+            # Même normalisation que is_positive, appliquée une seule fois
+            text = np.array([str(v) for v in vehicules_specs[col].tolist()], dtype=str)
+            stripped = np.char.strip(text)
+            positive[:, j] = np.isin(np.char.upper(stripped), POSITIVE_VALUES)
+            has_value[:, j] = stripped != ''
+            index[key] = j
+        names = vehicules_specs[schema.vehicle].tolist()
+        return cls(names=names, features=index, positive=positive, has_value=has_value)
+
+    def __len__(self):
+        return len(self.names)
+
+
+@dataclass
+class ScoringResult:
+    """Résultat du scoring de tout le catalogue pour un jeu de critères"""
+    scores: np.ndarray
+    compatible: np.ndarray
+    matches: list
+    mismatches: list
+
+    def __len__(self):
+        return len(self.scores)
+
+    def row(self, i):
+        """Retourner (score, matches, mismatches, is_compatible) pour le véhicule i"""
+        return int(self.scores[i]), self.matches[i], self.mismatches[i], bool(self.compatible[i])
+
+
+@dataclass
+class _Rule:
+    """Règle de scoring pour un critère actif"""
+    key: tuple
+    expect_positive: bool
+    penalty: int
+    match_message: str
+    mismatch_message: str
+    requires_value: bool = False
+    eliminatory: bool = False
+    missing_is_mismatch: bool = False
+
+
+def active_rules(criteria):
+    """Traduire un dictionnaire de critères en règles, dans l'ordre d'affichage"""
+    rules = []
+
+    # Critère : Pédaler
+    if criteria.get('pedaler') in ('OUI', 'NON'):
+        wants_pedaling = criteria['pedaler'] == 'OUI'
+        rules.append(_Rule(
+            key=('pedaler',),
+            expect_positive=wants_pedaling,
+            penalty=20,
+            match_message="✅ Nécessite de pédaler" if wants_pedaling else "✅ Pas besoin de pédaler",
+            mismatch_message=f"❌ Pédaler : {'non requis' if wants_pedaling else 'requis'}",
+            requires_value=True,
+            eliminatory=True
+        ))
+
+    # Critères : Passagers enfants et adultes (ignorer si 0)
+    for key, label in (('enfants', 'enfant(s)'), ('adultes', 'adulte(s)')):
+        n = criteria.get(f'nb_{key}')
+        if n is not None and n > 0:
+            rules.append(_Rule(
+                key=(key, n),
+                expect_positive=True,
+                penalty=25,
+                match_message=f"✅ Peut transporter {n} {label}",
+                mismatch_message=f"❌ Ne peut pas transporter {n} {label}",
+                eliminatory=True
+            ))
+
+    # Critère : Chargement
+    if criteria.get('chargement'):
+        rules.append(_Rule(
+            key=('chargement', criteria['chargement']),
+            expect_positive=True,
+            penalty=20,
+            match_message=f"✅ Capacité de chargement : {criteria['chargement']}",
+            mismatch_message="❌ Capacité de chargement insuffisante"
+        ))
+
+    # Critère : Couverture
+    if criteria.get('couverture') == "Totalement couvert":
+        rules.append(_Rule(
+            key=('couverture', "Totalement couvert"),
+            expect_positive=True,
+            penalty=15,
+            match_message="✅ Totalement couvert",
+            mismatch_message="❌ Pas totalement couvert",
+            missing_is_mismatch=True
+        ))
+    elif criteria.get('couverture') == "Partiellement couvert":
+        rules.append(_Rule(
+            key=('couverture', "Partiellement couvert"),
+            expect_positive=True,
+            penalty=10,
+            match_message="✅ Partiellement couvert",
+            mismatch_message="⚠️ Couverture différente",
+            missing_is_mismatch=True
+        ))
+
+    # Critère : Territoire
+    if criteria.get('territoire'):
+        rules.append(_Rule(
+            key=('territoire', criteria['territoire']),
+            expect_positive=True,
+            penalty=20,
+            match_message=f"✅ Adapté terrain {criteria['territoire'].lower()}",
+            mismatch_message=f"❌ Pas adapté terrain {criteria['territoire'].lower()}"
+        ))
+
+    return rules
+
+
+def _append_message(lists, mask, message):
+    """Ajouter un message aux véhicules sélectionnés par le masque"""
+    for i in np.flatnonzero(mask):
+        lists[i].append(message)
+
+
+def evaluate_rule(matrices, rule):
+    """Masques (respecté, non respecté) d'une règle sur tout le catalogue
+
+    Retourne None si la règle ne s'applique pas (colonne absente).
+    """
+    n_vehicles = len(matrices)
+    j = matrices.features.get(rule.key)
+    if j is None:
+        if rule.missing_is_mismatch:
+            return np.zeros(n_vehicles, dtype=bool), np.ones(n_vehicles, dtype=bool)
+        return None
+
+    positive = matrices.positive[:, j]
+    ok = positive if rule.expect_positive else ~positive
+    fail = ~ok
+    if rule.requires_value:
+        fail &= matrices.has_value[:, j]
+    return ok, fail
+
+
+def score_catalogue(matrices, criteria):
+    """Évaluer tous les véhicules du catalogue en une seule passe"""
+    n_vehicles = len(matrices)
+    penalties = np.zeros(n_vehicles, dtype=np.int64)
+    compatible = np.ones(n_vehicles, dtype=bool)
+    matches = [[] for _ in range(n_vehicles)]
+    mismatches = [[] for _ in range(n_vehicles)]
+
+    for rule in active_rules(criteria):
+        masks = evaluate_rule(matrices, rule)
+        if masks is None:
+            continue
+        ok, fail = masks
+
+        penalties[fail] += rule.penalty
+        if rule.eliminatory:
+            compatible &= ~fail
+        _append_message(matches, ok, rule.match_message)
+        _append_message(mismatches, fail, rule.mismatch_message)
+
+    scores = np.maximum(0, 100 - penalties)
+    return ScoringResult(scores=scores, compatible=compatible, matches=matches, mismatches=mismatches)
@@ -0,0 +1,323 @@
+"""Service HTTP JSON de recommandation
+
+Un seul processus garde en mémoire le catalogue compilé, le cache des
+recommandations et les agrégats d'expérience ; les requêtes sont traitées par
+un nombre borné de threads. Le catalogue et les expériences sont rechargés en
+arrière-plan quand leurs fichiers changent.
+
+    python service.py [--host 127.0.0.1] [--port 8502] [--workers 8]
+
+POST /recommendations avec les critères de l'application (pedaler,
+nb_enfants, nb_adultes, chargement, couverture, territoire) et, au besoin,
+tri_par et top :
+
+    curl -s localhost:8502/recommendations -d '{"pedaler": "NON", "nb_enfants": 2, "top": 5}'
+
+GET /health décrit le catalogue chargé et l'état du cache.
+
+Exports (csv, parquet ou xlsx), produits à la demande puis gardés par version
+des données et envoyés par morceaux :
+
+    curl -s localhost:8502/exports/catalogue.parquet -o catalogue.parquet
+    curl -s localhost:8502/exports/agregats.csv -o agregats.csv
+    curl -s localhost:8502/exports/recommandations.xlsx -d '{"pedaler": "NON"}' -o classement.xlsx
+"""
+import argparse
+import http.server
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import Recommender, profile_criteria, ranked_records
+from catalogue import CatalogueStore
+from experiences import ExperienceStore
+from exports import FORMATS, ExportCache
+from recommendation import SORT_OPTIONS, criteria_key
+from refresher import BackgroundRefresher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8502
+DEFAULT_WORKERS = 8
+
+# Connexions acceptées en attente d'un thread libre ; au-delà, réponse 503
+DEFAULT_MAX_PENDING = 64
+
+# Taille maximale d'une requête (octets)
+MAX_BODY = 64 * 1024
+
+# Taille des morceaux envoyés pour un export
+SEND_BUFFER = 1 << 20
+
+# Délai d'inactivité d'une connexion (secondes) : un client lent ou muet libère le worker
+REQUEST_TIMEOUT = 30
+
+
+class RequestError(ValueError):
+    """Requête invalide (réponse 400)"""
+
+
+class RecommendationHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "30veli"
+    timeout = REQUEST_TIMEOUT
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.server.health())
+        elif self.path.startswith('/exports/'):
+            self._export()
+        else:
+            self._send(404, {'error': f"Chemin inconnu : {self.path}"})
+
+    def do_POST(self):
+        if self.path.startswith('/exports/'):
+            self._export(self._read_json)
+            return
+        if self.path != '/recommendations':
+            self._send(404, {'error': f"Chemin inconnu : {self.path}"})
+            return
+        try:
+            self._send(200, self.server.recommendations(self._read_json()))
+        except (RequestError, TypeError, ValueError) as e:
+            self._send(400, {'error': str(e)})
+
+    def _export(self, read_payload=None):
+        try:
+            payload = read_payload() if read_payload is not None else {}
+            path, mime = self.server.export(self.path[len('/exports/'):], payload)
+        except (RequestError, TypeError, ValueError) as e:
+            self._send(400, {'error': str(e)})
+            return
+        self._send_file(path, mime)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length < 0:
+            raise RequestError(f"Content-Length invalide : {length}")
+        if length > MAX_BODY:
+            raise RequestError(f"Requête trop volumineuse ({length} octets)")
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            raise RequestError(f"JSON invalide : {e}")
+        if not isinstance(payload, dict):
+            raise RequestError("Les critères doivent être un objet JSON")
+        return payload
+
+    def _send(self, status, body):
+        content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_file(self, path, mime):
+        """Envoyer un fichier par morceaux (sans le charger en mémoire)"""
+        with open(path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', mime)
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, SEND_BUFFER)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class RecommendationServer(http.server.HTTPServer):
+    """Serveur HTTP dont les requêtes sont traitées par un pool de threads borné
+
+    Au plus workers requêtes en cours et max_pending en attente : les
+    connexions suivantes reçoivent aussitôt une réponse 503.
+    """
+
+    def __init__(self, address, recommender, experience_store=None, workers=DEFAULT_WORKERS,
+                 max_pending=DEFAULT_MAX_PENDING):
+        super().__init__(address, RecommendationHandler)
+        self.recommender = recommender
+        self.experience_store = experience_store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='veli-http')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._experience_lock = threading.Lock()
+        self._experience_data = None
+        self._experience_summary = {}
+        self.exports = ExportCache()
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _reject(self, request):
+        """Répondre 503 sans occuper de thread (file d'attente pleine)"""
+        content = json.dumps({'error': "Service surchargé, réessayez plus tard"}, ensure_ascii=False).encode('utf-8')
+        try:
+            request.settimeout(1)
+            request.sendall(
+                b"HTTP/1.0 503 Service Unavailable\r\n"
+                b"Content-Type: application/json; charset=utf-8\r\n"
+                b"Retry-After: 1\r\n"
+                + f"Content-Length: {len(content)}\r\n\r\n".encode('ascii') + content
+            )
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+    def experience_data(self):
+        """Agrégats des expériences servis (None sans magasin ou s'ils sont indisponibles)"""
+        if self.experience_store is None:
+            return None
+        try:
+            return self.experience_store.current()
+        except Exception as e:
+            logger.warning("Expériences indisponibles : %s", e)
+            return None
+
+    def experience_summary(self, data=None):
+        """Trajets et satisfaction par modèle, recalculés quand les expériences changent"""
+        data = data if data is not None else self.experience_data()
+        if data is None:
+            return {}
+        with self._experience_lock:
+            if data is not self._experience_data:
+                self._experience_summary = {
+                    model: {'trips': int(row.trips), 'satisfaction': round(float(row.satisfaction), 1)}
+                    for model, row in data.by_model[['trips', 'satisfaction']].iterrows()
+                }
+                self._experience_data = data
+            return self._experience_summary
+
+    def recommendations(self, payload):
+        """Réponse à POST /recommendations"""
+        tri_par = payload.get('tri_par') or SORT_OPTIONS[0]
+        if tri_par not in SORT_OPTIONS:
+            raise RequestError(f"Tri inconnu : {tri_par!r} (attendu : {', '.join(SORT_OPTIONS)})")
+        top = payload.get('top')
+        if top is not None and (not isinstance(top, int) or isinstance(top, bool) or top < 0):
+            raise RequestError("top doit être un entier positif")
+        criteria = profile_criteria(payload)
+
+        experience = self.experience_data()
+        result = self.recommender.recommend(criteria, experience)
+        ranked = result.sorted(tri_par) if not top else result.top(tri_par, top)
+        summary = self.experience_summary(experience)
+        records = ranked_records(ranked)
+        for record in records:
+            record['experience'] = summary.get(record['vehicle'])
+        return {
+            'criteria': dict(zip(
+                ('pedaler', 'nb_enfants', 'nb_adultes', 'chargement', 'couverture', 'territoire'),
+                criteria_key(criteria)
+            )),
+            'tri_par': tri_par,
+            'compatible': len(result),
+            'recommendations': records,
+            'filtered_out': [
+                {'vehicle': name, 'reasons': list(reasons)}
+                for name, reasons in result.filtered_out
+            ]
+        }
+
+    def export(self, name, payload):
+        """(chemin, type MIME) de l'export demandé (catalogue, agregats ou recommandations)"""
+        kind, _, fmt = name.partition('.')
+        if fmt not in FORMATS:
+            raise RequestError(f"Format inconnu : {fmt!r} (attendu : {', '.join(FORMATS)})")
+        mime = FORMATS[fmt][1]
+        catalogue = self.recommender.catalogue
+        if kind == 'catalogue':
+            return self.exports.catalogue(catalogue, fmt), mime
+        if kind == 'agregats':
+            experience = self.experience_data()
+            if experience is None:
+                raise RequestError("Retours d'expérience indisponibles")
+            return self.exports.aggregates(experience, fmt), mime
+        if kind == 'recommandations':
+            tri_par = payload.get('tri_par') or SORT_OPTIONS[0]
+            if tri_par not in SORT_OPTIONS:
+                raise RequestError(f"Tri inconnu : {tri_par!r} (attendu : {', '.join(SORT_OPTIONS)})")
+            criteria = profile_criteria(payload)
+            experience = self.experience_data()
+            result = self.recommender.recommend(criteria, experience, catalogue)
+            data_version = experience.version if experience is not None else None
+            return self.exports.recommendations(catalogue, result, criteria, tri_par, data_version, fmt), mime
+        raise RequestError(f"Export inconnu : {kind!r} (attendu : catalogue, agregats, recommandations)")
+
+    def health(self):
+        cache = self.recommender.cache
+        catalogue = self.recommender.catalogue
+        return {
+            'status': 'ok',
+            'vehicles': len(catalogue),
+            'catalogue_version': catalogue.version,
+            'cache': {'hits': cache.hits, 'misses': cache.misses},
+            'experiences': self.experience_store is not None
+        }
+
+
+def start_server(recommender, host='127.0.0.1', port=0, experience_store=None, workers=DEFAULT_WORKERS,
+                 max_pending=DEFAULT_MAX_PENDING):
+    """Démarrer le service dans un thread ; retourne le serveur (server.server_address)
+
+    Avec port=0, un port libre est choisi : pratique pour un client de test local.
+    Arrêt : server.shutdown() puis server.server_close().
+    """
+    server = RecommendationServer((host, port), recommender, experience_store, workers, max_pending)
+    thread = threading.Thread(target=server.serve_forever, name='veli-http-server', daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service HTTP JSON de recommandation")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="threads de traitement des requêtes")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help="requêtes en attente d'un thread au-delà desquelles le service répond 503")
+    parser.add_argument('--lattice', action='store_true', help="précalculer toutes les combinaisons de critères")
+    parser.add_argument('--no-experiences', action='store_true', help="ne pas charger les retours d'expérience")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    catalogue_store = CatalogueStore()
+    recommender = Recommender(lattice=args.lattice, store=catalogue_store)
+    experience_store = None if args.no_experiences else ExperienceStore()
+    tasks = [("catalogue", catalogue_store.reload)]
+    if experience_store is not None:
+        tasks.insert(0, ("expériences", experience_store.refresh))
+    BackgroundRefresher(tasks).start()
+    server = RecommendationServer((args.host, args.port), recommender, experience_store, args.workers,
+                                  args.max_pending)
+    print(f"✅ Service de recommandation sur http://{args.host}:{server.server_address[1]} "
+          f"({len(recommender.catalogue)} véhicules, {args.workers} threads)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
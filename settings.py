@@ -0,0 +1,22 @@
+"""Réglages communs (surchargés par variables d'environnement)"""
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Répertoire des instantanés et artefacts compilés
+CACHE_DIR = os.environ.get('VELI_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+
+# Précalculer les recommandations pour toutes les combinaisons de critères
+PRECOMPUTE_LATTICE = os.environ.get('VELI_PRECOMPUTE_LATTICE', '0') == '1'
+
+# Afficher le rapport de démarrage (temps des imports et premiers chargements)
+STARTUP_REPORT = os.environ.get('VELI_STARTUP_REPORT', '0') == '1'
+
+# Afficher le panneau de performances (latence des étapes, succès des caches)
+DEBUG_PANEL = os.environ.get('VELI_DEBUG_PANEL', '0') == '1'
+
+# Fichier JSON Lines des mesures de chaque rerun (désactivé si vide)
+METRICS_LOG = os.environ.get('VELI_METRICS_LOG')
+
+# Intervalle (secondes) des rechargements en arrière-plan (0 : à la demande seulement)
+REFRESH_INTERVAL = float(os.environ.get('VELI_REFRESH_INTERVAL', '300'))
@@ -0,0 +1,150 @@
+"""Données partagées en lecture seule entre sessions et processus
+
+Les tables sont écrites en Arrow IPC non compressé et projetées en mémoire :
+tous les processus qui les lisent partagent les mêmes pages du cache système,
+et les colonnes numériques sans valeur manquante ne sont pas copiées.
+
+Chaque version est un répertoire immuable ; un pointeur JSON, remplacé
+atomiquement, désigne la version courante. Un lecteur déjà attaché garde sa
+version (les fichiers supprimés restent lisibles tant qu'ils sont projetés)
+et passe à la suivante quand il relit le pointeur.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Versions conservées sur disque (la courante comprise)
+KEEP_VERSIONS = 2
+
+# Âge (secondes) au-delà duquel une version inachevée (.tmp) est abandonnée
+STALE_TMP_SECONDS = 3600
+
+
+def _arrow_column(series):
+    """Colonne Arrow ; les NaN des flottants restent des valeurs (lecture sans copie)"""
+    if pd.api.types.is_float_dtype(series.dtype):
+        return pa.array(series.to_numpy(), from_pandas=False)
+    return pa.array(series, from_pandas=True)
+
+
+def write_arrow(df, path):
+    """Écrire un DataFrame (sans son index) en Arrow IPC"""
+    table = pa.table({str(col): _arrow_column(df[col]) for col in df.columns})
+    with pa.OSFile(path, 'wb') as f:
+        with ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_arrow(path, columns=None):
+    """Projeter un fichier Arrow IPC en mémoire et le présenter en DataFrame"""
+    table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(split_blocks=True)
+
+
+def list_column(values):
+    """Colonne de listes relue depuis Arrow (tableaux NumPy) redevenue des listes Python"""
+    return [list(v) if isinstance(v, (list, np.ndarray)) else [] for v in values]
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+class VersionedDirectory:
+    """Répertoire de versions immuables désignées par un pointeur JSON"""
+
+    def __init__(self, root, pointer='current.json', keep=KEEP_VERSIONS):
+        self.root = root
+        self.pointer_path = os.path.join(root, pointer)
+        self.keep = keep
+
+    def read_pointer(self):
+        """Métadonnées de la version courante ({} si aucune)"""
+        try:
+            with open(self.pointer_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_pointer(self, meta):
+        """Remplacer le pointeur (la version désignée doit déjà exister)"""
+        _write_json(self.pointer_path, meta)
+
+    def path(self, version, name=None):
+        if name is None:
+            return os.path.join(self.root, version)
+        return os.path.join(self.root, version, name)
+
+    def publish(self, version, write, meta):
+        """Écrire une version (write(répertoire)) puis la désigner comme courante
+
+        Si la version existe déjà (publiée par un autre processus), elle est
+        réutilisée telle quelle.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        target = self.path(version)
+        if not os.path.isdir(target):
+            # Répertoire unique : plusieurs threads ou processus peuvent écrire la même version
+            tmp_dir = tempfile.mkdtemp(prefix=f"{version}.tmp", dir=self.root)
+            # mkdtemp crée le répertoire en 0700 : la version doit rester lisible par les autres lecteurs
+            os.chmod(tmp_dir, 0o755)
+            try:
+                write(tmp_dir)
+                os.rename(tmp_dir, target)
+            except OSError:
+                if not os.path.isdir(target):
+                    raise
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        meta = {**meta, 'version': version}
+        self.write_pointer(meta)
+        self.cleanup(version)
+        return meta
+
+    def cleanup(self, current, stale_after=STALE_TMP_SECONDS):
+        """Supprimer les versions les plus anciennes au-delà de keep
+
+        Les écritures inachevées (.tmp) plus anciennes que stale_after
+        secondes, laissées par un processus interrompu, sont aussi supprimées.
+        """
+        limit = time.time() - stale_after
+        try:
+            scanned = list(os.scandir(self.root))
+        except OSError:
+            return
+        # Date de chaque entrée ; une entrée supprimée entre-temps (autre processus) est ignorée
+        versions = []
+        stale = []
+        for entry in scanned:
+            try:
+                if '.tmp' in entry.name:
+                    if entry.stat(follow_symlinks=False).st_mtime < limit:
+                        stale.append(entry)
+                elif entry.is_dir() and entry.name != current:
+                    versions.append((entry.stat().st_mtime_ns, entry))
+            except OSError:
+                continue
+        versions.sort(key=lambda item: item[0], reverse=True)
+        for _, entry in versions[self.keep - 1:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+        for entry in stale:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
@@ -0,0 +1,447 @@
+"""Instantané local d'un export CSV distant
+
+La dernière copie valide est conservée sur disque en segments Parquet avec un
+fichier annexe JSON (ETag, Last-Modified, position lue, segments). Elle est
+servie immédiatement ; la revalidation se fait par requête conditionnelle, au
+besoin dans un thread en arrière-plan. Une source locale (chemin de fichier)
+est revalidée sur sa date de modification, pour les tests hors ligne.
+
+L'export étant en ajout seul, seuls les octets ajoutés depuis la dernière
+lecture sont téléchargés (requête Range) et analysés ; ils forment un nouveau
+segment. Si le début du fichier a changé, l'instantané est reconstruit en
+entier (nouvelle génération).
+
+Seuls les enregistrements complets sont analysés : le fichier téléchargé est
+coupé après la dernière fin de ligne hors guillemets, et la position lue
+n'avance que jusque-là. Une ligne en cours d'écriture (ou un commentaire sur
+plusieurs lignes coupé) est relue en entier au téléchargement suivant ; les
+validateurs ne sont alors pas enregistrés comme à jour. Si la source n'a pas
+changé entre deux téléchargements et que les guillemets sont équilibrés, la
+fin du fichier termine le dernier enregistrement (pas de fin de ligne finale).
+
+Le téléchargement est copié sur disque au fil de l'eau, puis analysé et
+enregistré par blocs de CHUNK_ROWS lignes (un groupe de lignes Parquet par
+bloc) ; la relecture (iter_since) se fait aussi par blocs. La mémoire
+nécessaire ne dépend pas de la taille de l'export.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = 30
+
+# Octets de fin de fichier mémorisés pour vérifier qu'un ajout prolonge bien la copie locale
+TAIL_BYTES = 256
+
+# Au-delà, les segments sont fusionnés en un seul fichier
+MAX_SEGMENTS = 16
+
+# Lignes analysées, écrites et relues à la fois
+CHUNK_ROWS = 100_000
+
+# Taille des blocs copiés lors d'un téléchargement (octets)
+COPY_BUFFER = 1 << 20
+
+_refresh_lock = threading.Lock()
+_refreshing = set()
+_snapshot_locks = {}
+
+
+def is_remote(source):
+    return str(source).startswith(('http://', 'https://'))
+
+
+def _atomic_write(path, write):
+    """Écrire dans un fichier temporaire puis le renommer"""
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def _copy(src, path, length=None):
+    """Copier un flux (au plus length octets) dans un fichier, par blocs ; retourne la taille copiée"""
+    copied = 0
+    with open(path, 'wb') as f:
+        while length is None or copied < length:
+            block = src.read(COPY_BUFFER if length is None else min(COPY_BUFFER, length - copied))
+            if not block:
+                break
+            f.write(block)
+            copied += len(block)
+    return copied
+
+
+def _complete_length(path, eof_is_boundary=False):
+    """Taille du début du fichier formé d'enregistrements CSV complets
+
+    C'est la position qui suit la dernière fin de ligne hors guillemets (0 si
+    aucune) ; les guillemets doublés d'un champ se compensent. Avec
+    eof_is_boundary, la fin du fichier compte aussi si elle est hors guillemets.
+    """
+    complete = 0
+    quoted = False
+    position = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(COPY_BUFFER)
+            if not block:
+                break
+            # Dernière fin de ligne du bloc précédée d'un nombre pair de guillemets
+            end = len(block)
+            while True:
+                newline = block.rfind(b'\n', 0, end)
+                if newline < 0:
+                    break
+                if (quoted + block.count(b'"', 0, newline)) % 2 == 0:
+                    complete = position + newline + 1
+                    break
+                end = newline
+            quoted = (quoted + block.count(b'"')) % 2 == 1
+            position += len(block)
+    if eof_is_boundary and not quoted:
+        return position
+    return complete
+
+
+def _file_tail(path, previous=b''):
+    """Derniers octets d'un fichier, précédés au besoin de ceux de la copie précédente"""
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path) - TAIL_BYTES))
+        return (previous + f.read())[-TAIL_BYTES:]
+
+
+def _segment_schema(schema):
+    """Schéma commun aux blocs d'un segment : index des catégories en int32
+
+    Le type des codes d'une colonne catégorielle dépend du nombre de
+    catégories du bloc ; il est élargi pour que tous les blocs s'y convertissent.
+    """
+    fields = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            value_type = field.type.value_type
+            if pa.types.is_null(value_type):
+                value_type = pa.large_string()
+            field = field.with_type(pa.dictionary(pa.int32(), value_type))
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+class CsvSnapshot:
+    """Copie locale d'un CSV distant, revalidée par requêtes conditionnelles
+
+    prepare est appliqué à chaque DataFrame lu avant l'enregistrement
+    (normalisation) ; il doit traiter les lignes indépendamment les unes des
+    autres pour que l'ingestion incrémentale donne le même résultat.
+    read_options est transmis à pandas.read_csv (usecols, dtype...).
+    """
+
+    def __init__(self, source, directory, name, prepare=None, read_options=None, chunksize=CHUNK_ROWS):
+        self.source = source
+        self.directory = directory
+        self.name = name
+        self.meta_path = os.path.join(directory, f"{name}.json")
+        self.prepare = prepare
+        self.read_options = read_options or {}
+        self.chunksize = chunksize
+
+    def read_meta(self):
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def version(self):
+        """Identifiant de la version enregistrée (None si aucun instantané)"""
+        try:
+            return os.stat(self.meta_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, segment['file'])
+
+    def exists(self):
+        meta = self.read_meta()
+        return bool(meta.get('segments')) and all(
+            os.path.exists(self._segment_path(s)) for s in meta['segments']
+        )
+
+    def load(self, meta=None, columns=None):
+        """Lire la dernière copie valide (None si aucun instantané)"""
+        meta = meta or self.read_meta()
+        if not meta.get('segments'):
+            return None
+        return self.load_since(0, meta, columns)
+
+    def load_since(self, start, meta=None, columns=None):
+        """Lire uniquement les lignes enregistrées après les start premières
+
+        columns limite la lecture à certaines colonnes (format en colonnes).
+        """
+        frames = list(self.iter_since(start, meta, columns))
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def iter_since(self, start=0, meta=None, columns=None):
+        """Itérer par blocs (au plus chunksize lignes) sur les lignes après les start premières"""
+        meta = meta or self.read_meta()
+        first_row = 0
+        for segment in meta.get('segments', []):
+            last_row = first_row + segment['rows']
+            if last_row > start:
+                parquet = pq.ParquetFile(self._segment_path(segment))
+                for batch in parquet.iter_batches(batch_size=self.chunksize, columns=columns):
+                    batch_first = first_row
+                    first_row += batch.num_rows
+                    if first_row > start:
+                        yield batch.slice(max(0, start - batch_first)).to_pandas()
+            first_row = last_row
+
+    # --- Téléchargement ---------------------------------------------------
+
+    def _fetch_local(self, meta, spool):
+        """Copier le fichier local s'il a changé ; (validateurs, ajout seul) ou None"""
+        stat = os.stat(self.source)
+        validators = {'last_modified': stat.st_mtime_ns, 'size': stat.st_size}
+        if all(meta.get(k) == v for k, v in validators.items()):
+            return None
+        with open(self.source, 'rb') as f:
+            offset = meta.get('offset')
+            tail = bytes.fromhex(meta.get('tail', ''))
+            if offset and stat.st_size >= offset:
+                f.seek(offset - len(tail))
+                if f.read(len(tail)) == tail:
+                    _copy(f, spool, stat.st_size - offset)
+                    return validators, True
+                f.seek(0)
+            _copy(f, spool, stat.st_size)
+            return validators, False
+
+    def _fetch_remote(self, meta, spool, incremental=True):
+        """Télécharger la source si elle a changé ; (validateurs, ajout seul) ou None
+
+        Le corps de la réponse est copié dans spool sans être gardé en mémoire.
+        """
+        request = urllib.request.Request(self.source)
+        if meta.get('etag'):
+            request.add_header('If-None-Match', meta['etag'])
+        if meta.get('last_modified'):
+            request.add_header('If-Modified-Since', meta['last_modified'])
+        offset = meta.get('offset')
+        tail = bytes.fromhex(meta.get('tail', ''))
+        if incremental and offset:
+            request.add_header('Range', f"bytes={offset - len(tail)}-")
+        try:
+            with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+                validators = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+                appended = response.status == 206
+                if not appended or response.read(len(tail)) == tail:
+                    _copy(response, spool)
+                    return validators, appended
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            if e.code == 416 and incremental:
+                # Fichier plus court que la copie locale : il a été réécrit
+                return self._fetch_remote({}, spool, incremental=False)
+            raise
+        # La copie locale ne correspond plus au début du fichier
+        return self._fetch_remote({}, spool, incremental=False)
+
+    def _fetch(self, meta, spool):
+        if is_remote(self.source):
+            return self._fetch_remote(meta, spool)
+        return self._fetch_local(meta, spool)
+
+    # --- Enregistrement ---------------------------------------------------
+
+    def _parse(self, path, meta=None):
+        """Analyser un fichier CSV par blocs ; sans en-tête si meta décrit déjà les colonnes"""
+        options = dict(self.read_options)
+        if meta is not None:
+            options['dtype'] = {
+                **{col: str for col in meta['text_columns']},
+                **options.get('dtype', {})
+            }
+            # Les lignes vides (fin de ligne de la copie précédente) sont ignorées
+            options.update(header=None, names=meta['columns'])
+        try:
+            with pd.read_csv(path, chunksize=self.chunksize, **options) as reader:
+                for df in reader:
+                    if self.prepare is not None:
+                        df = self.prepare(df)
+                    if len(df):
+                        yield df
+        except pd.errors.EmptyDataError:
+            # Aucune ligne (ajout limité à une fin de ligne)
+            return
+
+    def _write_segment(self, frames, generation, seq):
+        """Écrire des blocs dans un segment (un groupe de lignes par bloc) ; None si aucun"""
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            return None
+        segment = {'file': f"{self.name}-{generation}-{seq}.parquet", 'rows': 0}
+
+        def write(path):
+            table = pa.Table.from_pandas(first, preserve_index=False)
+            with pq.ParquetWriter(path, _segment_schema(table.schema)) as writer:
+                for df in itertools.chain([first], frames):
+                    writer.write_table(pa.Table.from_pandas(df, preserve_index=False).cast(writer.schema))
+                    segment['rows'] += len(df)
+
+        _atomic_write(self._segment_path(segment), write)
+        return segment
+
+    def _write_meta(self, meta, obsolete=()):
+        _atomic_write(self.meta_path, lambda path: _write_json(path, meta))
+        for segment in obsolete:
+            try:
+                os.remove(self._segment_path(segment))
+            except OSError:
+                pass
+
+    def save(self, spool, validators, previous=None):
+        """Enregistrer une copie complète (nouvelle génération) à partir du fichier téléchargé"""
+        os.makedirs(self.directory, exist_ok=True)
+        generation = (previous or {}).get('generation', 0) + 1
+        raw_columns = list(pd.read_csv(spool, nrows=0).columns)
+        frames = self._parse(spool)
+        first = next(frames, None)
+        text_columns = [] if first is None else [
+            col for col in raw_columns
+            if col in first.columns and not pd.api.types.is_numeric_dtype(first[col])
+        ]
+        segment = self._write_segment(itertools.chain([first], frames) if first is not None else (), generation, 0)
+        meta = {
+            **validators,
+            'source': str(self.source),
+            'fetched_at': time.time(),
+            'generation': generation,
+            'columns': raw_columns,
+            'text_columns': text_columns,
+            'offset': os.path.getsize(spool),
+            'tail': _file_tail(spool).hex(),
+            'rows': segment['rows'] if segment else 0,
+            'seq': 0,
+            'segments': [segment] if segment else []
+        }
+        self._write_meta(meta, obsolete=(previous or {}).get('segments', []))
+        return meta
+
+    def append(self, spool, validators, meta):
+        """Ajouter les lignes du fichier téléchargé (ajout seul) comme un segment supplémentaire"""
+        segments = list(meta['segments'])
+        obsolete = []
+        seq = meta.get('seq', 0) + 1
+        segment = self._write_segment(self._parse(spool, meta), meta['generation'], seq)
+        n_rows = segment['rows'] if segment else 0
+        if segment:
+            segments.append(segment)
+            if len(segments) > MAX_SEGMENTS:
+                # Compaction : mêmes lignes, même génération (relues par blocs)
+                merged = self.iter_since(0, {**meta, 'segments': segments})
+                obsolete = segments
+                seq += 1
+                segments = [self._write_segment(merged, meta['generation'], seq)]
+            meta = {**meta, 'seq': seq}
+        new_meta = {
+            **meta,
+            **validators,
+            'fetched_at': time.time(),
+            'offset': meta['offset'] + os.path.getsize(spool),
+            'tail': _file_tail(spool, bytes.fromhex(meta['tail'])).hex(),
+            'rows': meta['rows'] + n_rows,
+            'segments': segments
+        }
+        self._write_meta(new_meta, obsolete=obsolete)
+        return new_meta
+
+    def refresh(self):
+        """Revalider l'instantané ; retourne True si une nouvelle version a été enregistrée
+
+        Une seule revalidation à la fois par instantané dans le processus.
+        """
+        with _refresh_lock:
+            lock = _snapshot_locks.setdefault(self.meta_path, threading.Lock())
+        with lock:
+            return self._refresh()
+
+    def _refresh(self):
+        meta = self.read_meta() if self.exists() else {}
+        os.makedirs(self.directory, exist_ok=True)
+        spool = os.path.join(self.directory, f"{self.name}.download.tmp{os.getpid()}.{threading.get_ident()}")
+        try:
+            fetched = self._fetch(meta, spool)
+            if fetched is None:
+                logger.info("Instantané %s à jour", self.meta_path)
+                return False
+            validators, appended = fetched
+            # Enregistrement incomplet en fin de fichier : laissé pour le téléchargement
+            # suivant, sauf si la source est restée identique depuis le précédent
+            unchanged = any(v is not None for v in validators.values()) and meta.get('pending') == validators
+            complete = _complete_length(spool, eof_is_boundary=unchanged)
+            if complete < os.path.getsize(spool) and (appended or complete > 0):
+                os.truncate(spool, complete)
+                # Validateurs gardés à part : le prochain téléchargement relira la fin
+                validators = {**{k: None for k in validators}, 'pending': validators}
+            else:
+                validators = {**validators, 'pending': None}
+            if appended:
+                previous_rows = meta['rows']
+                meta = self.append(spool, validators, meta)
+                logger.info("Instantané %s : %d ligne(s) ajoutée(s)", self.meta_path, meta['rows'] - previous_rows)
+            else:
+                meta = self.save(spool, validators, previous=meta)
+                logger.info("Instantané %s reconstruit (%d lignes)", self.meta_path, meta['rows'])
+            return True
+        finally:
+            if os.path.exists(spool):
+                os.remove(spool)
+
+    def refresh_in_background(self):
+        """Lancer refresh() dans un thread (un seul à la fois par instantané)"""
+        with _refresh_lock:
+            if self.meta_path in _refreshing:
+                return None
+            _refreshing.add(self.meta_path)
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Revalidation de %s impossible : %s", self.source, e)
+            finally:
+                with _refresh_lock:
+                    _refreshing.discard(self.meta_path)
+
+        thread = threading.Thread(target=run, name=f"refresh-{self.name}", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,70 @@
+"""Instantané CSV : seuls les enregistrements complets sont enregistrés"""
+from snapshot import CsvSnapshot
+
+HEADER = "Model,commentaires,bilan,totalDistanceKm\n"
+READ_OPTIONS = {'dtype': {'Model': str, 'commentaires': str, 'bilan': str}}
+
+
+def _snapshot(tmp_path, source):
+    return CsvSnapshot(str(source), str(tmp_path / 'cache'), 'experiences', read_options=READ_OPTIONS)
+
+
+def _write(path, text, mode='w'):
+    with open(path, mode, encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def test_truncated_last_line_is_read_once_complete(tmp_path):
+    source = tmp_path / 'export.csv'
+    _write(source, HEADER + "M1,,Bien,3\nM2,,Bie")
+    snapshot = _snapshot(tmp_path, source)
+
+    assert snapshot.refresh()
+    assert snapshot.read_meta()['rows'] == 1
+    assert snapshot.load()['Model'].tolist() == ['M1']
+
+    _write(source, "n,7\n", mode='a')
+    assert snapshot.refresh()
+    trips = snapshot.load()
+    assert trips['Model'].tolist() == ['M1', 'M2']
+    assert trips['bilan'].tolist() == ['Bien', 'Bien']
+    assert trips['totalDistanceKm'].tolist() == [3, 7]
+
+
+def test_quoted_newline_split_at_boundary(tmp_path):
+    source = tmp_path / 'export.csv'
+    _write(source, HEADER + 'M1,"ok",Bien,3\nM2,"première ligne\nseconde')
+    snapshot = _snapshot(tmp_path, source)
+
+    assert snapshot.refresh()
+    assert snapshot.load()['Model'].tolist() == ['M1']
+
+    _write(source, ' ligne, ""fin""",Neutre,5\nM3,,Bien,1\n', mode='a')
+    assert snapshot.refresh()
+    trips = snapshot.load()
+    assert trips['Model'].tolist() == ['M1', 'M2', 'M3']
+    assert trips['commentaires'][1] == 'première ligne\nseconde ligne, "fin"'
+    assert trips['bilan'].tolist() == ['Bien', 'Neutre', 'Bien']
+    assert snapshot.read_meta()['offset'] == source.stat().st_size
+
+
+def test_last_record_without_newline_is_read_once_unchanged(tmp_path):
+    source = tmp_path / 'export.csv'
+    _write(source, HEADER + "M1,,Bien,3\nM2,,Bien,7")
+    snapshot = _snapshot(tmp_path, source)
+
+    # Premier téléchargement : la dernière ligne peut être en cours d'écriture
+    assert snapshot.refresh()
+    assert snapshot.load()['Model'].tolist() == ['M1']
+
+    # Source inchangée : la fin du fichier termine l'enregistrement
+    assert snapshot.refresh()
+    trips = snapshot.load()
+    assert trips['Model'].tolist() == ['M1', 'M2']
+    assert trips['totalDistanceKm'].tolist() == [3, 7]
+    assert not snapshot.refresh()
+
+    _write(source, "\nM3,,Neutre,1\n", mode='a')
+    assert snapshot.refresh()
+    assert snapshot.load()['Model'].tolist() == ['M1', 'M2', 'M3']
+    assert snapshot.read_meta()['offset'] == source.stat().st_size
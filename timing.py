@@ -0,0 +1,214 @@
+"""Temps de démarrage et latence des reruns de l'application
+
+StartupReport mesure chaque étape (imports, chargement du catalogue, des
+expériences, premiers graphiques...) la première fois qu'elle s'exécute dans
+le processus : le rapport décrit ce que coûte un démarrage à froid.
+
+RerunMetrics mesure les étapes de chaque rerun (chargements, scoring, tri,
+cartes, graphiques) sur une fenêtre glissante, compte les succès des caches
+et peut écrire une ligne JSON par rerun (VELI_METRICS_LOG).
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from settings import METRICS_LOG
+
+logger = logging.getLogger(__name__)
+
+# Journal structuré des reruns (une ligne JSON par rerun)
+metrics_logger = logging.getLogger(f"{__name__}.metrics")
+
+# Mesures conservées par étape pour le calcul des percentiles
+WINDOW = 1000
+
+PERCENTILES = (50, 90, 99)
+
+# Début approximatif du processus (premier import de ce module)
+PROCESS_START = time.perf_counter()
+
+
+class StartupReport:
+    """Durée de la première exécution de chaque étape"""
+
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.stages = {}
+        self.first_render = None
+        self._last_mark = start
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages.setdefault(name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Mesurer le bloc (seule la première exécution est retenue)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def mark(self, name):
+        """Retenir le temps écoulé depuis le repère précédent (ex. fin des imports)"""
+        now = time.perf_counter()
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = now - self._last_mark
+            self._last_mark = now
+
+    def finish(self):
+        """Fin du premier affichage : le rapport est journalisé une seule fois"""
+        with self._lock:
+            if self.first_render is not None:
+                return
+            self.first_render = time.perf_counter() - self.start
+        logger.info("Démarrage : premier affichage en %.0f ms (%s)", self.first_render * 1000, ", ".join(
+            f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.rows()
+        ))
+
+    def rows(self):
+        """(étape, secondes) dans l'ordre d'exécution"""
+        with self._lock:
+            return list(self.stages.items())
+
+
+STARTUP = StartupReport()
+
+
+def percentile(values, q):
+    """Percentile q (0-100) d'une liste triée, au rang le plus proche"""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class RerunMetrics:
+    """Latence des étapes de chaque rerun et succès des caches, pour tout le processus
+
+    Chaque rerun (start_run ... finish_run) s'exécute dans son propre thread :
+    les étapes mesurées pendant ce rerun y sont aussi cumulées.
+    """
+
+    def __init__(self, window=WINDOW, log_path=None):
+        self.window = window
+        self._durations = {}
+        self._counts = Counter()
+        self._lookups = Counter()
+        self._misses = Counter()
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if log_path:
+            handler = logging.FileHandler(log_path, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            metrics_logger.addHandler(handler)
+            metrics_logger.setLevel(logging.INFO)
+
+    def start_run(self):
+        """Début d'un rerun ; retourne ses mesures (étape -> secondes cumulées)"""
+        run = {'start': time.perf_counter(), 'stages': {}}
+        self._local.run = run
+        return run
+
+    @contextmanager
+    def stage(self, name):
+        """Mesurer le bloc à chaque exécution"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=self.window)
+            self._durations[name].append(seconds)
+            self._counts[name] += 1
+        run = getattr(self._local, 'run', None)
+        if run is not None:
+            run['stages'][name] = run['stages'].get(name, 0) + seconds
+
+    def finish_run(self, run):
+        """Fin d'un rerun : durée totale retenue (étape « rerun ») et journalisée"""
+        total = time.perf_counter() - run['start']
+        self._local.run = None
+        self.record('rerun', total)
+        if metrics_logger.isEnabledFor(logging.INFO):
+            metrics_logger.info(json.dumps({
+                'event': 'rerun',
+                'timestamp': time.time(),
+                'total_ms': round(total * 1000, 3),
+                'stages': {name: round(seconds * 1000, 3) for name, seconds in run['stages'].items()},
+                'caches': {row['cache']: [row['hits'], row['misses']] for row in self.cache_rates()}
+            }, ensure_ascii=False))
+        return total
+
+    def lookup(self, cache):
+        """Appel d'une fonction mise en cache (voir miss)"""
+        with self._lock:
+            self._lookups[cache] += 1
+
+    def miss(self, cache):
+        """Appel non servi par le cache (à placer dans le corps de la fonction)"""
+        with self._lock:
+            self._misses[cache] += 1
+
+    def watch_cache(self, cache, counters):
+        """Suivre un cache qui tient ses propres compteurs (attributs hits et misses)"""
+        with self._lock:
+            self._watched[cache] = counters
+
+    def percentiles(self):
+        """Latence de chaque étape (ms) : nombre de mesures, percentiles et maximum"""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._durations.items()}
+            counts = dict(self._counts)
+        rows = []
+        for name, values in samples.items():
+            row = {'stage': name, 'count': counts[name]}
+            for q in PERCENTILES:
+                row[f"p{q}_ms"] = percentile(values, q) * 1000
+            row['max_ms'] = values[-1] * 1000
+            rows.append(row)
+        return rows
+
+    def cache_rates(self):
+        """Succès et échecs de chaque cache, avec le taux de succès"""
+        with self._lock:
+            counters = {
+                cache: (lookups - self._misses[cache], self._misses[cache])
+                for cache, lookups in self._lookups.items()
+            }
+            counters.update({
+                cache: (watched.hits, watched.misses) for cache, watched in self._watched.items()
+            })
+        return [
+            {
+                'cache': cache,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else None
+            }
+            for cache, (hits, misses) in counters.items()
+        ]
+
+    def export(self):
+        """Instantané sérialisable des mesures (étapes et caches)"""
+        return {
+            'timestamp': time.time(),
+            'window': self.window,
+            'stages': self.percentiles(),
+            'caches': self.cache_rates()
+        }
+
+
+METRICS = RerunMetrics(log_path=METRICS_LOG)